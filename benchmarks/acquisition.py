@@ -0,0 +1,255 @@
+""" Acquisition throughput benchmark, run against the simulated instruments.
+
+usage: python benchmarks/acquisition.py [--profile ideal gpib lab] [--sizes 100 1000 ...] [--cases thzScan pmpScan scan]
+                                        [--repeat N] [--save NAME] [--compare NAME] [--no-memory]
+
+Each case runs per scan length: N times clean for the points/second, once with probes around the instrument,
+settle, writer, signal and plot calls for the per-point breakdown, and N times under tracemalloc for the memory
+peak; the medians of the N runs are kept. The live plot is connected as in thzcontrol but is not redrawn during
+the runs, so that the memory peak does not depend on how many points each frame receives; the cost of one frame
+of the final trace is measured separately. Results can be saved as a JSON baseline and later runs compared
+against it.
+"""
+import os
+import sys
+import json
+import time as tm
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+from PyQt6.QtWidgets import QApplication
+from instruments import LockIn, Cernox, KBD101, OttimeDelayline, Simulator
+from experiment import Parameters, Measurement, ScanWriter
+from interface import LivePlot
+
+
+BASELINE_FOLDER = os.path.join(ROOT, 'benchmarks', 'baselines')
+TOLERANCE       = 0.2    # relative change tolerated before a result counts as a regression
+FLOORS          = {'frame_ms': 5.0, 'peak_mb': 1.0}   # absolute changes never counted as regressions (timer, allocator noise)
+REPEATS         = 3      # clean and tracemalloc runs per case, compared by their median
+STEP            = 1e-4   # mm, small enough for 1M points within the delay-line ranges
+TCONS           = 10e-6  # s, fastest lock-in time constant, so that the loop overhead dominates
+
+# latency (s per GPIB transaction), timed stages, default scan lengths
+PROFILES = {
+    'ideal': (0.0,  False, (100, 1000, 10_000, 100_000, 1_000_000)),
+    'gpib':  (8e-3, False, (100, 1000)),
+    'lab':   (8e-3, True,  (100, 1000)),
+}
+CASES = ('thzScan', 'pmpScan', 'scan')
+
+
+class Bench:
+    def __init__(self, latency, stage_timing, output):
+        Simulator(latency=latency, stage_timing=stage_timing).install()
+
+        self.lockin = LockIn()
+        self.cernox = Cernox()
+        self.thz_dl = KBD101("THz delay-line")
+        self.pmp_dl = OttimeDelayline("Pump delay-line")
+        for instrument, address in ((self.lockin, Simulator.LOCKIN_ADDRESS), (self.cernox, Simulator.MULTIMETER_ADDRESS),
+                                    (self.thz_dl, Simulator.KBD101_SERIAL), (self.pmp_dl, Simulator.OTTIME_ADDRESS)):
+            instrument.setAddress(address)
+            instrument.connect()
+        self.lockin.setTcons(TCONS)
+
+        os.chdir(output)   # the scans, checkpoint and catalog are written to a throwaway folder
+        self.parameters  = Parameters(self.lockin, self.cernox)
+        self.measurement = Measurement(self.parameters, self.lockin, self.cernox, self.thz_dl, self.pmp_dl)
+        self.liveplot    = LivePlot()
+
+        signals = self.measurement.signals
+        signals.cleared.connect(lambda pos: self.liveplot.reset(pos))
+        signals.updated.connect(lambda i, x, y: self.liveplot.update(i, x, y))
+        signals.averaged.connect(lambda i, x, y, err: self.liveplot.updateBand(i, x, y, err))
+
+    def setup(self, case, N):
+        """ Sets the parameters of an N points scan and returns the arguments of the case; the step is
+        slightly shortened so that Measurement.scan rounds the range to exactly N points """
+        thz_end = round(STEP * (N - 1), 4) if case != 'pmpScan' else 0.0
+        pmp_end = round(STEP * (N - 1), 4) if case == 'pmpScan' else 0.0
+        values  = {'thz_start': 0.0, 'thz_end': thz_end, 'thz_vel': 10, 'thz_step': STEP * (1 - 1e-9),
+                   'pmp_start': 0.0, 'pmp_end': pmp_end, 'pmp_vel': 10, 'pmp_step': STEP * (1 - 1e-9),
+                   'wait': 1, 'plot_fps': 30, 'mode': 'step', 'settle': 0, 'user': 'benchmark'}
+        for param, value in values.items():
+            for group in (self.parameters.mandatory, self.parameters.info):
+                if param in group.dictionary:
+                    group.dictionary[param].setValue(str(value))
+        self.parameters.retrieveHiddenParams()
+
+        tcons = float(self.parameters.hidden.tcons.value)
+        pos   = np.around(np.linspace(0.0, STEP * (N - 1), N), decimals=4)
+        return pos, tcons
+
+    def run(self, case, N):
+        pos, tcons = self.setup(case, N)
+        m = self.measurement
+        m.setBreak(False)
+        t0 = tm.perf_counter()
+        if case == 'scan':
+            m.scan()
+        else:
+            m.thzScan(N, pos, tcons, 1, 30) if case == 'thzScan' else m.pmpScan(N, pos, tcons, 1, 30)
+            m.writer.close()
+        return tm.perf_counter() - t0
+
+    def frame(self):
+        """ Time (s) of one live plot frame of the trace left by the last run """
+        self.liveplot._dirty = 'line'
+        t0 = tm.perf_counter()
+        self.liveplot._redraw()
+        self.liveplot.grab()
+        return tm.perf_counter() - t0
+
+
+class Probes:
+    """ Accumulates the time spent in selected methods, grouped by phase """
+    def __init__(self):
+        self.totals = {}
+        self._patched = []
+
+    def wrap(self, owner, name, phase):
+        original = getattr(owner, name)
+        totals   = self.totals
+
+        def probe(*args, **kwargs):
+            t0 = tm.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                totals[phase] = totals.get(phase, 0.0) + tm.perf_counter() - t0
+
+        self._patched.append((owner, name, owner.__dict__.get(name)))
+        setattr(owner, name, probe)
+
+    def restore(self):
+        for owner, name, original in reversed(self._patched):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._patched = []
+
+
+@contextmanager
+def probed(bench):
+    probes = Probes()
+    m = bench.measurement
+    for delay_line in (bench.thz_dl, bench.pmp_dl):
+        probes.wrap(delay_line, 'moveTo', 'move')
+    probes.wrap(bench.lockin, 'X', 'read')
+    probes.wrap(m, '_settle', 'settle')
+    probes.wrap(m, '_emitRange', 'emit')
+    probes.wrap(bench.liveplot, 'update', 'plot')
+    probes.wrap(ScanWriter, 'append', 'save')
+    try:
+        yield probes.totals
+    finally:
+        probes.restore()
+
+
+def benchmark(bench, case, N, memory=True, repeats=REPEATS):
+    bench.run(case, min(N, 100))   # warm-up: imports, file system caches, first allocations
+
+    runs = [(bench.run(case, N), bench.frame()) for _ in range(repeats)]
+    elapsed, frame = np.median(runs, axis=0)
+
+    with probed(bench) as totals:
+        probed_elapsed = bench.run(case, N)
+    # the plot slot runs inside the emission here, but in the GUI thread in thzcontrol
+    totals['emit'] = totals.get('emit', 0.0) - totals.get('plot', 0.0)
+    breakdown = {phase: 1e6 * total / N for phase, total in totals.items()}
+    breakdown['other'] = max(1e6 * probed_elapsed / N - sum(breakdown.values()), 0.0)
+
+    result = {'points': N, 'repeats': repeats, 'elapsed_s': elapsed, 'points_per_s': N / elapsed, 'frame_ms': 1e3 * frame,
+              'breakdown_us': breakdown}
+    if memory:
+        peaks = []
+        for _ in range(repeats):
+            tracemalloc.start()
+            bench.run(case, N)
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1e6)
+            tracemalloc.stop()
+        result['peak_mb'] = float(np.median(peaks))
+    return result
+
+
+def exceeds(value, reference, floor):
+    return value > (1 + TOLERANCE) * reference and value - reference > floor
+
+
+def compare(results, baseline):
+    """ Prints the changes against the baseline and returns the number of regressions """
+    regressions = 0
+    for profile, cases in results.items():
+        for case, sizes in cases.items():
+            for N, result in sizes.items():
+                reference = baseline.get(profile, {}).get(case, {}).get(N)
+                if reference is None:
+                    continue
+                checks = [('points_per_s', result['points_per_s'] < (1 - TOLERANCE) * reference['points_per_s']),
+                          ('frame_ms', exceeds(result['frame_ms'], reference['frame_ms'], FLOORS['frame_ms']))]
+                if 'peak_mb' in result and 'peak_mb' in reference:
+                    checks.append(('peak_mb', exceeds(result['peak_mb'], reference['peak_mb'], FLOORS['peak_mb'])))
+                for metric, regressed in checks:
+                    change = result[metric] / reference[metric] - 1 if reference[metric] else 0.0
+                    flag   = "REGRESSION" if regressed else ""
+                    print(f"{profile:6}{case:9}{N:>9}  {metric:13}{reference[metric]:12.4g} -> {result[metric]:<12.4g}{change:+7.1%}  {flag}")
+                    regressions += regressed
+    return regressions
+
+
+def report(profile, case, result):
+    breakdown = '  '.join(f"{phase} {us:.1f}" for phase, us in sorted(result['breakdown_us'].items()))
+    peak      = f"{result['peak_mb']:8.1f} MB" if 'peak_mb' in result else ""
+    print(f"{profile:6}{case:9}{result['points']:>9}  {result['points_per_s']:10.1f} pts/s  "
+          f"frame {result['frame_ms']:6.1f} ms{peak}  [us/pt: {breakdown}]")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profile', nargs='+', default=['ideal'], choices=PROFILES)
+    parser.add_argument('--sizes', nargs='+', type=int, help="scan lengths, the profile defaults otherwise")
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=CASES)
+    parser.add_argument('--repeat', type=int, default=REPEATS, help="runs per case, their median is kept")
+    parser.add_argument('--save', metavar='NAME', help="stores the results as benchmarks/baselines/NAME.json")
+    parser.add_argument('--compare', metavar='NAME', help="compares the results with a stored baseline")
+    parser.add_argument('--no-memory', action='store_true', help="skips the tracemalloc pass")
+    args = parser.parse_args()
+
+    app     = QApplication(sys.argv[:1])
+    results = {}
+    cwd     = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as output:
+        for profile in args.profile:
+            latency, stage_timing, sizes = PROFILES[profile]
+            bench = Bench(latency, stage_timing, output)
+            for case in args.cases:
+                for N in args.sizes or sizes:
+                    result = benchmark(bench, case, N, memory=not args.no_memory, repeats=args.repeat)
+                    results.setdefault(profile, {}).setdefault(case, {})[str(N)] = result
+                    report(profile, case, result)
+        os.chdir(cwd)
+
+    if args.save:
+        os.makedirs(BASELINE_FOLDER, exist_ok=True)
+        metadata = {'date': tm.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                    'machine': platform.platform()}
+        with open(os.path.join(BASELINE_FOLDER, f'{args.save}.json'), 'w') as file:
+            json.dump({'metadata': metadata, 'results': results}, file, indent=1)
+        print(f"Saved baseline {args.save}")
+
+    if args.compare:
+        with open(os.path.join(BASELINE_FOLDER, f'{args.compare}.json')) as file:
+            baseline = json.load(file)
+        print(f"Compared with {args.compare} ({baseline['metadata']['date']}, {baseline['metadata']['machine']})")
+        sys.exit(1 if compare(results, baseline['results']) else 0)
\ No newline at end of file
@@ -0,0 +1,9 @@
+import sys
+from experiment.container import ScanContainer
+
+
+if __name__ == '__main__':
+    # usage: python convert_archive.py [data folder] [info folder]
+    if not ScanContainer.available:
+        sys.exit("h5py is required to convert the archive")
+    ScanContainer.convertArchive(*sys.argv[1:3])
\ No newline at end of file
@@ -1,2 +1,7 @@
 from .parameters import Parameters
-from .measurement import Measurement
\ No newline at end of file
+from .measurement import Measurement
+from .writer import ScanWriter
+from .catalog import Catalog
+from .spectrum import IncrementalSpectrum
+from .temperature_log import TemperatureLogger
+from .scan_queue import ScanQueue
\ No newline at end of file
@@ -0,0 +1,132 @@
+import os
+import glob
+import sqlite3
+from pandas import read_sql_query, read_table
+from .parameters import HiddenParams, MandatoryParams, InfoParams
+from .container import ScanContainer
+
+
+class Catalog:
+    DATABASE    = './output/catalog.sqlite'
+    DATA_FOLDER = './output/data'
+    INFO_FOLDER = './output/info'
+
+    def __init__(self, database=DATABASE):
+        self._database = database
+        self._groups   = {'mandatory': MandatoryParams(), 'info': InfoParams(), 'hidden': HiddenParams()}
+        self._fields   = [param for group in self._groups.values() for param in group.dictionary]
+
+        self._createTable()
+
+    @property
+    def database(self): return self._database
+    @property
+    def fields(self): return ['path', 'timestamp', 'mtime', 'complete'] + self._fields
+
+    def _connect(self):
+        # one short-lived connection per call, so that the GUI and the scan thread can both use the catalog
+        return sqlite3.connect(self.database, timeout=10)
+
+    def _createTable(self):
+        columns = ', '.join(f'"{field}" NUMERIC' for field in self._fields)
+        with self._connect() as connection:
+            connection.execute(f'CREATE TABLE IF NOT EXISTS scans (path TEXT PRIMARY KEY, timestamp TEXT, mtime REAL, complete INTEGER, {columns})')
+            # catalogs created before a parameter was added get its column, empty for the scans already indexed
+            existing = {row[1] for row in connection.execute('PRAGMA table_info(scans)')}
+            for field in self._fields:
+                if field not in existing:
+                    connection.execute(f'ALTER TABLE scans ADD COLUMN "{field}" NUMERIC')
+            for field in ['timestamp'] + self._fields:
+                connection.execute(f'CREATE INDEX IF NOT EXISTS "idx_{field}" ON scans ("{field}")')
+
+    def add(self, path, parameters, complete=True, connection=None):
+        """ Inserts or updates a scan, given its path and parameter groups (a Parameters.snapshot dict) """
+        values = {param: str(value) for group in parameters.values() for param, value in group.items() if param in self._fields}
+        row    = {'path': os.path.normpath(path), 'timestamp': os.path.basename(path)[:15],
+                  'mtime': os.path.getmtime(path), 'complete': int(complete), **values}
+
+        columns = ', '.join(f'"{column}"' for column in row)
+        sql     = f'INSERT OR REPLACE INTO scans ({columns}) VALUES ({", ".join("?" * len(row))})'
+        if connection is None:
+            with self._connect() as connection:
+                connection.execute(sql, list(row.values()))
+        else:
+            connection.execute(sql, list(row.values()))
+
+    def rebuild(self, data_folder=DATA_FOLDER, info_folder=INFO_FOLDER):
+        """ Indexes new or modified scans of the archive and forgets deleted ones; unchanged files are skipped """
+        with self._connect() as connection:
+            known = dict(connection.execute('SELECT path, mtime FROM scans').fetchall())
+            found = set()
+            added = 0
+
+            for path in self._scanFiles(data_folder):
+                found.add(path)
+                if known.get(path) == os.path.getmtime(path):
+                    continue
+                try:
+                    parameters, complete = self._readParameters(path, data_folder, info_folder)
+                    self.add(path, parameters, complete, connection)
+                    added += 1
+                except:
+                    print(f"Could not index {path}")
+
+            removed = [path for path in known if path not in found]
+            connection.executemany('DELETE FROM scans WHERE path = ?', [(path,) for path in removed])
+
+        print(f"Catalog updated: {added} scans indexed, {len(removed)} removed")
+
+    @staticmethod
+    def _scanFiles(data_folder):
+        """ Returns one file per scan: a scan converted by convert_archive.py keeps its .dat next to the
+        container, and only the container is indexed """
+        paths = {}
+        for path in sorted(glob.glob(f'{data_folder}/*/*.dat') + glob.glob(f'{data_folder}/*/*{ScanContainer.EXTENSION}')):
+            path = os.path.normpath(path)
+            stem = os.path.splitext(path)[0]
+            if stem not in paths or path.endswith(ScanContainer.EXTENSION):
+                paths[stem] = path
+        return sorted(paths.values())
+
+    def _readParameters(self, path, data_folder, info_folder):
+        if path.endswith(ScanContainer.EXTENSION):
+            parameters, attrs = ScanContainer.readParameters(path)
+            return parameters, bool(attrs.get('complete', True))
+
+        txt   = f"{info_folder}/{os.path.relpath(path, data_folder)[:-len('.dat')]}.txt"
+        table = read_table(txt, index_col=0).fillna('')
+        return {'table': {param: table['value'][param] for param in table.index}}, True
+
+    def query(self, **filters):
+        """ Returns the matching scans as a DataFrame. A filter value can be a number or string (equal),
+        a string with * wildcards (like), or a (min, max) tuple (between); e.g. query(user='Nick', temp=(4, 12)) """
+        conditions, values = [], []
+        for field, value in filters.items():
+            if field not in self.fields:
+                raise KeyError(f"Unknown catalog field '{field}'")
+            if isinstance(value, tuple):
+                conditions.append(f'"{field}" BETWEEN ? AND ?')
+                values.extend(value)
+            elif isinstance(value, str) and '*' in value:
+                conditions.append(f'"{field}" LIKE ?')
+                values.append(value.replace('*', '%'))
+            else:
+                conditions.append(f'"{field}" = ?')
+                values.append(value)
+
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        with self._connect() as connection:
+            return read_sql_query(f'SELECT * FROM scans{where} ORDER BY timestamp', connection, params=values)
+
+    @staticmethod
+    def parseFilters(text):
+        """ Parses 'user=Nick temp=4..12 sample=GaAs*' into query keyword arguments """
+        filters = {}
+        for token in text.split():
+            field, _, value = token.partition('=')
+            if '..' in value:
+                low, high = value.split('..')
+                filters[field] = (float(low), float(high))
+            else:
+                filters[field] = value
+        return filters
\ No newline at end of file
@@ -0,0 +1,107 @@
+import os
+import glob
+import numpy as np
+from pandas import DataFrame, read_table
+from .parameters import HiddenParams, MandatoryParams, InfoParams
+from .timing import Timer
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+class ScanContainer:
+    EXTENSION   = '.h5'
+    COMPRESSION = 'gzip'
+
+    available = h5py is not None
+
+    @classmethod
+    def write(cls, path, data, parameters, attrs={}, timing={}, temperature=None):
+        """ Writes the scan data (a dict of arrays or a DataFrame) as compressed datasets, the parameter groups (a
+        Parameters.snapshot dict), extra attributes (timestamps, IDNs...), the
+        acquisition timing (a Timer.summary dict) and the temperature trace (a
+        TemperatureLogger.trace DataFrame) to an HDF5 file """
+        with h5py.File(path + '.tmp', 'w') as file:
+            datasets = file.create_group('data')
+            for name, values in cls._arrays(data).items():
+                datasets.create_dataset(name, data=values, chunks=True, compression=cls.COMPRESSION, shuffle=True)
+
+            for group, values in parameters.items():
+                params = file.create_group(f'parameters/{group}')
+                for param, value in values.items():
+                    params.attrs[param] = value
+
+            for key, value in attrs.items():
+                file.attrs[key] = value
+                
+            for phase, stats in timing.items():
+                group = file.create_group(f'timing/{phase}')
+                group.create_dataset('histogram', data=stats['histogram'])
+                for key, value in stats.items():
+                    if key != 'histogram':
+                        group.attrs[key] = value
+            if timing:
+                file['timing'].attrs['bin_edges'] = Timer.binEdges()
+                
+            if temperature is not None and len(temperature):
+                group = file.create_group('temperature')
+                for name in temperature.columns:
+                    group.create_dataset(name, data=temperature[name].to_numpy())
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def read(cls, path):
+        """ Returns the data as a dict of arrays, the parameter groups and the file attributes """
+        with h5py.File(path, 'r') as file:
+            data = {name: dataset[()] for name, dataset in file['data'].items()}
+        return (data, *cls.readParameters(path))
+
+    @classmethod
+    def readParameters(cls, path):
+        """ Returns only the parameter groups and the file attributes, without loading the data """
+        with h5py.File(path, 'r') as file:
+            parameters = {group: dict(file[f'parameters/{group}'].attrs) for group in file.get('parameters', {})}
+            attrs      = dict(file.attrs)
+        return parameters, attrs
+
+    @staticmethod
+    def _arrays(data):
+        if isinstance(data, dict):
+            return {str(name): np.asarray(values) for name, values in data.items()}
+        # the DataFrame of a 2D grid scan has one 'pmp' column followed by one column per THz position
+        dataframe = data
+        if dataframe.columns[0] == 'pmp':
+            return {'pmp': dataframe['pmp'].to_numpy(dtype=float),
+                    'thz': np.array(dataframe.columns[1:], dtype=float),
+                    'X':   dataframe.iloc[:, 1:].to_numpy(dtype=float)}
+        return {str(column): dataframe[column].to_numpy() for column in dataframe.columns}
+
+    @classmethod
+    def convertArchive(cls, data_folder='./output/data', info_folder='./output/info'):
+        """ Converts every .dat/.txt pair of the archive into an .h5 file next to the .dat """
+        groups = {'mandatory': MandatoryParams(), 'info': InfoParams(), 'hidden': HiddenParams()}
+        converted = 0
+
+        for dat in sorted(glob.glob(f'{data_folder}/*/*.dat')):
+            h5  = dat[:-len('.dat')] + cls.EXTENSION
+            txt = f"{info_folder}/{os.path.relpath(dat, data_folder)[:-len('.dat')]}.txt"
+            if os.path.exists(h5) and os.path.getmtime(h5) >= os.path.getmtime(dat):
+                continue
+            try:
+                dataframe  = read_table(dat)
+                parameters = {}
+                if os.path.exists(txt):
+                    table = read_table(txt, index_col=0).fillna('')
+                    for name, group in groups.items():
+                        parameters[name] = {p: str(table['value'][p]) for p in group.dictionary if p in table.index}
+                if dataframe.columns[0] == 'pmp':
+                    dataframe.columns = ['pmp'] + [float(c) for c in dataframe.columns[1:]]
+                cls.write(h5, dataframe, parameters, {'source': os.path.basename(dat)})
+                converted += 1
+            except:
+                print(f"Could not convert {dat}")
+
+        print(f"Converted {converted} scans to {cls.EXTENSION}")
+        return converted
\ No newline at end of file
@@ -1,8 +1,17 @@
 import os
+import json
+import threading
+import traceback
 import time as tm
 import numpy as np
 from pandas import DataFrame
 from PyQt6.QtCore import QObject, QThreadPool, QRunnable, pyqtSignal, pyqtSlot
+from instruments.errors import instrumentErrors
+from .writer import ScanWriter
+from .container import ScanContainer
+from .catalog import Catalog
+from .timing import Timer, NullTimer
+from .temperature_log import TemperatureLogger
 
 
 class Constants:
@@ -20,9 +29,15 @@ class Convert:
         
         
 class MeasurementSignals(QObject):
-    started  = pyqtSignal()
-    updated  = pyqtSignal(object, object)
-    finished = pyqtSignal()
+    # the update signals only carry copies of the new values, written at a start index of the plot
+    started     = pyqtSignal()
+    cleared     = pyqtSignal(object)                       # positions of the new 1D scan
+    gridCleared = pyqtSignal(object, object)               # x and y axes of the new 2D scan
+    updated     = pyqtSignal(int, object, object)          # start, x, y
+    averaged    = pyqtSignal(int, object, object, object)  # start, x, y, y error
+    imaged      = pyqtSignal(int, object)                  # row index, row values
+    timed       = pyqtSignal(object)                       # Timer.summary of the acquisition phases
+    finished    = pyqtSignal()
     
     
 class MeasurementWorker(QRunnable):
@@ -36,8 +51,26 @@ class MeasurementWorker(QRunnable):
         
         
 class Measurement:
+    MODES       = ('step', 'fly', 'adaptive')
     DATA_FOLDER = './output/data/' + tm.strftime('%Y%m%d')
     INFO_FOLDER = './output/info/' + tm.strftime('%Y%m%d')
+    CHECKPOINT_FILE = './output/checkpoint.json'
+    
+    FLY_OVERSAMPLING  = 4    # buffer samples per thz_step
+    FLY_POLLING       = 10   # ms, Kinesis position polling period
+    FLY_READ_INTERVAL = 0.5  # s, buffer readout period during the sweep
+    FLY_FILTER_DELAY  = 1    # tcons per filter stage, lag of the lock-in output behind the stage
+    FLY_START_GRACE   = 1.0  # s, time allowed for the stage to report motion
+    
+    SETTLE_INTERVAL   = 0.5  # tcons per filter stage, spacing between the settle check readings
+    SETTLE_CONFIRM    = 2    # consecutive converged checks needed to release
+    
+    ADAPTIVE_COARSE    = 10    # thz_step, step of the coarse pass
+    ADAPTIVE_THRESHOLD = 5     # noise standard deviations of X or of its curvature that flag a region
+    ADAPTIVE_MARGIN    = 1     # coarse steps refilled on each side of a flagged coarse point
+    TIMING_INTERVAL    = 1     # s, between two timing summaries sent to the GUI
+    STATE_INTERVAL     = 10    # s, between two checks of the lock-in configuration during a scan
+    RETURN_VELOCITY    = 100   # mm/s, of the delay-lines returning to the start positions
     
     def __init__(self, parameters, lockin, cernox, thz_dl, pmp_dl):
         self.parameters = parameters
@@ -45,10 +78,28 @@ class Measurement:
         self.cernox  = cernox
         self.thz_dl  = thz_dl
         self.pmp_dl  = pmp_dl
-        self.signals = MeasurementSignals()
-        self.break_  = False
+        self.signals  = MeasurementSignals()
+        self.break_   = False
+        self._stopped = threading.Event()   # set with break_, cuts the waits short
+        self.writer   = None
+        self.rep      = 0
+        self.filename = None
+        self.started  = None
+        self.status   = None   # outcome of the last scan: 'completed', 'stopped' or 'failed'
+        self.saved    = []     # files written by the last scan
+        self._resume  = None
+        self._resumable = True
+        self._plotted = 0.0
+        self._timed   = 0.0
+        self.timer    = NullTimer()
+        self._rep_t0  = 0.0
+        self._checked = 0.0
+        self.lockin_state   = {}   # lock-in configuration at the start of the repetition
+        self.lockin_changes = []   # external changes found during the repetition
         
         self._checkOutputFolders()
+        self.catalog = Catalog()
+        self.thermometer = TemperatureLogger(cernox)
     
     def _checkOutputFolders(self):
         folders = [self.DATA_FOLDER, self.INFO_FOLDER]
@@ -56,106 +107,747 @@ class Measurement:
             if not os.path.exists(folder):
                 os.makedirs(folder)
                 print(f"Created {folder} folder")
+        for file in ScanWriter.partialFiles(self.DATA_FOLDER):
+            print(f"Found incomplete scan data: {file}")
         print("Measurement output folders OK")
         
-    def _save(self, dataframe):
-        filename = self.parameters.generateFilename()
+    def _openWriter(self, columns, resumable=True):
+        """ Starts streaming a scan to disk, or continues the one being resumed; returns the writer
+        and the rows already acquired. The data stays marked incomplete until _save """
+        checkpoint, self._resume = self._resume, None
+        self._resumable = resumable
+        
+        if resumable and checkpoint and checkpoint['filename'] and os.path.exists(checkpoint['partial']):
+            self.filename = checkpoint['filename']
+            # checkpoints written before the start time was recorded: the filename begins with it
+            self.started  = checkpoint.get('started') or tm.strftime('%Y-%m-%dT%H:%M:%S', tm.strptime(self.filename[:15], '%Y%m%d-%H%M%S'))
+            rows, _ = ScanWriter.read(checkpoint['partial'])
+            self.writer = ScanWriter(checkpoint['partial'][:-len(ScanWriter.PARTIAL_SUFFIX)], columns, append=True)
+            rows = rows.iloc[:self.writer.count]
+            print(f"Resuming {self.filename} after {len(rows)} points")
+        else:
+            self.filename = self.parameters.generateFilename()
+            self.started  = tm.strftime('%Y-%m-%dT%H:%M:%S')
+            if not ScanContainer.available:
+                self.parameters.save(self.INFO_FOLDER, f"{self.filename}.txt")
+            self.writer = ScanWriter(f"{self.DATA_FOLDER}/{self.filename}.dat", columns)
+            rows = DataFrame(columns=columns, dtype=float)
+            
+        self._saveCheckpoint(self.rep, self.filename, self.writer.partial_path)
+        return self.writer, rows
+        
+    def _save(self, data):
+        """ Writes the scan data, a dict of columns (2D scans: the pmp and thz axes, the X and settle images) """
+        filename    = self.filename
+        temperature = self.thermometer.trace(self._rep_t0)
+        
+        if ScanContainer.available:
+            self.writer.close(complete=not self.break_ or not self._resumable)
+            attrs = {'started': self.started, 'saved': tm.strftime('%Y-%m-%dT%H:%M:%S'), 'complete': not self.break_}
+            attrs.update(self._instrumentIDNs())
+            attrs['lockin state']   = json.dumps(self.lockin_state)
+            attrs['lockin changes'] = json.dumps(self.lockin_changes)
+            path = f"{self.DATA_FOLDER}/{filename}{ScanContainer.EXTENSION}"
+            ScanContainer.write(path, data, self.parameters.snapshot(), attrs, self.timer.summary(), temperature)
+        else:
+            path = f"{self.DATA_FOLDER}/{filename}.dat"
+            self.parameters.save(self.INFO_FOLDER, f"{filename}.txt")
+            complete = not self.break_ or not self._resumable
+            if 'thz' in data:
+                # the .dat of a 2D scan is a table of one row per pump position, one column per THz position
+                self.writer.close(self._gridTable(data, 'X'), complete)
+                ScanWriter.write(f"{self.INFO_FOLDER}/{filename}_settle.txt", self._gridTable(data, 'settle'))
+            elif list(data) == self.writer.columns:
+                # the streamed rows are the data: the partial file becomes the .dat, no second copy is written
+                self.writer.finalize(complete)
+            else:
+                self.writer.close(data, complete)
+            if self.timer.enabled:
+                self.timer.save(self.INFO_FOLDER, f"{filename}_timing.txt")
+            if len(temperature):
+                temperature.to_csv(f"{self.INFO_FOLDER}/{filename}_temperature.txt", sep='\t', index=False)
+            if self.lockin_changes:
+                with open(f"{self.INFO_FOLDER}/{filename}_lockin.json", 'w') as file:
+                    json.dump({'state': self.lockin_state, 'changes': self.lockin_changes}, file, indent=1)
+        
+        if self.timer.enabled:
+            self.signals.timed.emit(self.timer.summary())
         
-        self.parameters.save(self.INFO_FOLDER, f"{filename}.txt")
-        dataframe.to_csv(f"{self.DATA_FOLDER}/{filename}.dat", sep='\t', index=False)
+        try:
+            self.catalog.add(path, self.parameters.snapshot(), not self.break_)
+        except:
+            print(f"Could not add {filename} to the catalog")
+        self.saved.append(path)
+        if not self.break_:
+            self._saveCheckpoint(self.rep + 1)
         message = f"Saved data as {filename}"
         print(message)
+        
+    @staticmethod
+    def _gridTable(data, image):
+        return {'pmp': data['pmp'], **dict(zip(data['thz'], data[image].T))}
+        
+    def _instrumentIDNs(self):
+        idns = {}
+        for instrument in (self.lockin, self.cernox, self.thz_dl, self.pmp_dl):
+            try:
+                idns[f"idn {instrument.name}"] = instrument.idn.strip()
+            except:
+                print(f"Could not retrieve the {instrument.name} IDN")
+        return idns
+        
+    def _saveCheckpoint(self, rep, filename=None, partial=None):
+        checkpoint = {'parameters': self.parameters.snapshot(), 'rep': rep, 'filename': filename, 'partial': partial,
+                      'started': self.started}
+        with open(self.CHECKPOINT_FILE + '.tmp', 'w') as file:
+            json.dump(checkpoint, file, indent=1)
+        os.replace(self.CHECKPOINT_FILE + '.tmp', self.CHECKPOINT_FILE)
+        
+    @classmethod
+    def hasCheckpoint(cls):
+        """ Whether an interrupted scan can be resumed """
+        return os.path.exists(cls.CHECKPOINT_FILE)
+        
+    def _loadCheckpoint(self):
+        try:
+            with open(self.CHECKPOINT_FILE) as file:
+                return json.load(file)
+        except:
+            return None
+            
+    def _clearCheckpoint(self):
+        if os.path.exists(self.CHECKPOINT_FILE):
+            os.remove(self.CHECKPOINT_FILE)
 
     def scan(self):
-        thz_start = float(self.parameters.mandatory.thz_start.value)
-        thz_end   = float(self.parameters.mandatory.thz_end.value)
-        thz_step  = float(self.parameters.mandatory.thz_step.value) 
-        thz_vel   = float(self.parameters.mandatory.thz_vel.value)
-        
-        pmp_start = float(self.parameters.mandatory.pmp_start.value)
-        pmp_end   = float(self.parameters.mandatory.pmp_end.value)
-        pmp_step  = float(self.parameters.mandatory.pmp_step.value) 
-        pmp_vel   = float(self.parameters.mandatory.pmp_vel.value)
-        
-        tcons     = float(self.parameters.hidden.tcons.value) 
-        wait      = float(self.parameters.mandatory.wait.value)
-        plot_rate = int(self.parameters.mandatory.plot_rate.value)
-        repeat    = int(self.parameters.unsavable.repeat.value)
-        
-        thz_N = int( abs(thz_end - thz_start) / thz_step ) + 1
-        pmp_N = int( abs(pmp_end - pmp_start) / pmp_step ) + 1
-        
-        thz_pos = np.around( np.linspace(thz_start, thz_end, thz_N), decimals=4 )
-        pmp_pos = np.around( np.linspace(pmp_start, pmp_end, pmp_N), decimals=4 )
-        
-        for rep in range(repeat):
-            self.parameters.updateTemperature()
-        
-            self.thz_dl.returnTo(thz_start)
-            self.pmp_dl.returnTo(pmp_start)
-            self.thz_dl.setVelocity(thz_vel)
-            self.pmp_dl.setVelocity(pmp_vel)
-            tm.sleep(10 * tcons)
-
-            if pmp_N == 1 and thz_N != 1:
-                df = self.thzScan(thz_N, thz_pos, tcons, wait, plot_rate)
-            elif thz_N == 1 and pmp_N != 1:
-                df = self.pmpScan(pmp_N, pmp_pos, tcons, wait, plot_rate)
-            else:
-                print("Pump scan or THz scan must be fixed, and not both")
-                break
+        self.status, self.saved, self.writer = None, [], None
+        
+        try:
+            thz_start = float(self.parameters.mandatory.thz_start.value)
+            thz_end   = float(self.parameters.mandatory.thz_end.value)
+            thz_step  = float(self.parameters.mandatory.thz_step.value) 
+            thz_vel   = float(self.parameters.mandatory.thz_vel.value)
+            
+            pmp_start = float(self.parameters.mandatory.pmp_start.value)
+            pmp_end   = float(self.parameters.mandatory.pmp_end.value)
+            pmp_step  = float(self.parameters.mandatory.pmp_step.value) 
+            pmp_vel   = float(self.parameters.mandatory.pmp_vel.value)
+            
+            tcons     = float(self.parameters.hidden.tcons.value) 
+            sens      = float(self.parameters.hidden.sens.value or 0)
+            wait      = float(self.parameters.mandatory.wait.value)
+            tol_pct   = float(self.parameters.mandatory.settle.value or 0)
+            tol       = tol_pct / 100 * sens * self.lockin.sensUnit()   # sens is in nA or mV, depending on the input
+            plot_rate = int(self.parameters.mandatory.plot_fps.value)
+            mode      = self.parameters.mandatory.mode.value
+            repeat    = int(self.parameters.unsavable.repeat.value)
+            channels  = self._channels()
+            
+            if tol_pct and not tol:
+                print("Warning: the lock-in sensitivity is unknown, the settle tolerance is ignored and each point waits the full wait time")
+            
+            thz_N = int( abs(thz_end - thz_start) / thz_step ) + 1
+            pmp_N = int( abs(pmp_end - pmp_start) / pmp_step ) + 1
+            
+            thz_pos = np.around( np.linspace(thz_start, thz_end, thz_N), decimals=4 )
+            pmp_pos = np.around( np.linspace(pmp_start, pmp_end, pmp_N), decimals=4 )
+            
+            average  = self.parameters.unsavable.average.value and repeat > 1 and mode == 'step' and (thz_N == 1) != (pmp_N == 1)
+            keep_raw = self.parameters.unsavable.keep_raw.value
             
-            self._save(df)
+            first    = self._resume['rep'] if self._resume else 0
             
+            self.thermometer.setRate(float(self.parameters.unsavable.temp_rate.value))
+            self.thermometer.start()
+            
+            if average:
+                self.rep = 0
+                self._prepareRepetition(thz_start, thz_vel, pmp_start, pmp_vel, tcons, tol)
+                if not self.break_:
+                    delay_line, pos = (self.thz_dl, thz_pos) if pmp_N == 1 else (self.pmp_dl, pmp_pos)
+                    data = self.averageScan(delay_line, pos, repeat, tcons, wait, plot_rate, tol, keep_raw)
+                    self._save(data)
+            
+            for rep in range(first, 0 if average else repeat):
+                self.rep = rep
+                self._prepareRepetition(thz_start, thz_vel, pmp_start, pmp_vel, tcons, tol)
+                if self.break_:
+                    break
+
+                if pmp_N == 1 and thz_N != 1 and mode == 'fly':
+                    data = self.flyScan(thz_pos, thz_step, thz_vel, tcons)
+                elif pmp_N == 1 and thz_N != 1 and mode == 'adaptive':
+                    data = self.adaptiveScan(thz_pos, tcons, wait, plot_rate, tol)
+                elif pmp_N == 1 and thz_N != 1:
+                    data = self.thzScan(thz_N, thz_pos, tcons, wait, plot_rate, tol, channels)
+                elif thz_N == 1 and pmp_N != 1:
+                    data = self.pmpScan(pmp_N, pmp_pos, tcons, wait, plot_rate, tol, channels)
+                elif thz_N != 1 and pmp_N != 1:
+                    data = self.gridScan(thz_pos, pmp_pos, tcons, wait, plot_rate, tol)
+                else:
+                    print("Pump scan or THz scan must be set, not both fixed")
+                    self.status = 'failed'
+                    break
+                
+                self._save(data)
+                
+                if self.break_:
+                    break
+                    
+            if not self.break_ and self.status is None:
+                self._clearCheckpoint()
+        except Exception as error:
+            self.status = 'stopped' if self.break_ else 'failed'
+            if self.writer is None:
+                outcome = "no point was acquired"
+            elif self._resumable:
+                outcome = "it can be resumed from the Control page"
+            else:
+                outcome = "the points acquired so far are kept"
             if self.break_:
-                break
-                                
+                print(f"The scan was stopped during an instrument operation, {outcome}")
+            elif isinstance(error, instrumentErrors()):
+                print(f"The scan was interrupted by an instrument error ({error}), {outcome}")
+            else:
+                print(f"The scan was interrupted by an unexpected error, {outcome}")
+                traceback.print_exc()
+            if self.writer and not self.writer.closed:
+                if self._resumable:
+                    self.writer.close(complete=False)
+                else:
+                    # the adaptive and fly scans restart from scratch: their rows are kept as a finished file
+                    self.writer.finalize()
+        
+        # the Cernox is only polled during the scans
+        self.thermometer.stop()
+        if self.break_:
+            self._reportPositions()
+        if self.status is None:
+            self.status = 'stopped' if self.break_ else 'completed'
         self.signals.finished.emit()
+        return self.status
              
     
-    def thzScan(self, N, pos, tcons, wait, plot_rate):
-        X = np.full(N, np.nan)
+    def _prepareRepetition(self, thz_start, thz_vel, pmp_start, pmp_vel, tcons, tol):
+        self.timer    = Timer() if self.parameters.unsavable.timing.value else NullTimer()
+        self._rep_t0  = tm.time()
+        self._checked = tm.perf_counter()
+        self.lockin_changes = []
+        try:
+            self.lockin_state = self.lockin.refreshState()
+        except:
+            self.lockin_state = {}
+            print("Could not read the lock-in configuration")
+        self._updateTemperature()
         
-        for i in range(N):
+        if self.break_:
+            return
+        # the delay-lines are independent: both return at the same time, each on its instrument thread
+        returns = [delay_line.io.submit(self._returnTo, delay_line, start) for delay_line, start in ((self.thz_dl, thz_start), (self.pmp_dl, pmp_start))]
+        for future in returns:
+            future.result()
+        self.thz_dl.setVelocity(thz_vel)
+        self.pmp_dl.setVelocity(pmp_vel)
+        self._settle(tcons, 10 * tcons, tol)
+    
+    def _returnTo(self, delay_line, position):
+        """ The delay-line returnTo, run on its thread: a stop landing between the velocity change and the
+        move would reach an idle stage and be lost, so the move is skipped once the scan is stopped """
+        delay_line.setVelocity(self.RETURN_VELOCITY)
+        if not self._stopped.is_set():
+            delay_line.moveTo(position)
+    
+    def _updateTemperature(self):
+        """ Takes the logged temperature, and reads the Cernox only when the logger has no recent value """
+        latest = self.thermometer.latest()
+        self.parameters.updateTemperature(latest if latest is not None else self.thermometer.sample())
+    
+    def thzScan(self, N, pos, tcons, wait, plot_rate, tol=0, channels=('X',)):
+        X      = np.full(N, np.nan)
+        extra  = {channel: np.full(N, np.nan) for channel in channels[1:]}
+        settle = np.full(N, np.nan)
+        writer, rows = self._openWriter(['pos', 'X', *extra, 'settle'])
+        done = len(rows)
+        X[:done], settle[:done] = rows['X'], rows['settle']
+        for channel in extra:
+            extra[channel][:done] = rows[channel]
+        self.signals.cleared.emit(pos)
+        plotted = self._emitRange(0, done, pos, X)
+        timer   = self.timer
+        timer.start()
+        
+        for i in range(done, N):
             self.thz_dl.moveTo(pos[i])
-            tm.sleep(wait * tcons)
-            X[i] = self.lockin.X()
-            if i% plot_rate == 0:
-                self.signals.updated.emit(pos, X)
+            timer.lap('move')
+            settle[i] = self._settle(tcons, wait * tcons, tol)
+            timer.lap('settle')
+            X[i], *values = self._read(channels)
+            for channel, value in zip(extra, values):
+                extra[channel][i] = value
+            timer.lap('read')
+            writer.append(pos[i], X[i], *(extra[channel][i] for channel in extra), settle[i])
+            timer.lap('save')
+            if self._plotDue(plot_rate):
+                plotted = self._emitRange(plotted, i + 1, pos, X)
+            timer.lap('emit')
+            self._checkState()
+            timer.lap('check')
                     
             if self.break_:
                 break
         
-        df = DataFrame({'pos': pos, 'X': X})
-        return df
+        self._emitRange(plotted, writer.count, pos, X)
+        return {'pos': pos, 'X': X, **extra, 'settle': settle}
         
-    def pmpScan(self, N, pos, tcons, wait, plot_rate):
-        X = np.full(N, np.nan)
+    def pmpScan(self, N, pos, tcons, wait, plot_rate, tol=0, channels=('X',)):
+        X      = np.full(N, np.nan)
+        extra  = {channel: np.full(N, np.nan) for channel in channels[1:]}
+        settle = np.full(N, np.nan)
+        writer, rows = self._openWriter(['pos', 'X', *extra, 'settle'])
+        done = len(rows)
+        X[:done], settle[:done] = rows['X'], rows['settle']
+        for channel in extra:
+            extra[channel][:done] = rows[channel]
+        self.signals.cleared.emit(pos)
+        plotted = self._emitRange(0, done, pos, X)
+        timer   = self.timer
+        timer.start()
         
-        for i in range(N):
+        for i in range(done, N):
             try:
                 self.pmp_dl.moveTo(pos[i])
-                tm.sleep(wait * tcons)
-                X[i] = self.lockin.X()
+                timer.lap('move')
+                settle[i] = self._settle(tcons, wait * tcons, tol)
+                timer.lap('settle')
+                X[i], *values = self._read(channels)
+                for channel, value in zip(extra, values):
+                    extra[channel][i] = value
+                timer.lap('read')
             except:
                 print(f"Pump delay-line error at {pos[i]}mm")
+            writer.append(pos[i], X[i], *(extra[channel][i] for channel in extra), settle[i])
+            timer.lap('save')
             
-            if i% plot_rate == 0:
-                self.signals.updated.emit(pos, X)
+            if self._plotDue(plot_rate):
+                plotted = self._emitRange(plotted, i + 1, pos, X)
+            timer.lap('emit')
+            self._checkState()
+            timer.lap('check')
                     
             if self.break_:
                 break
         
-        df = DataFrame({'pos': pos, 'X': X})
-        return df
+        self._emitRange(plotted, writer.count, pos, X)
+        return {'pos': pos, 'X': X, **extra, 'settle': settle}
+        
+    def _checkState(self):
+        """ Re-reads the lock-in configuration every STATE_INTERVAL and records the changes made outside
+        the program, which the scan would otherwise never notice """
+        now = tm.perf_counter()
+        if now - self._checked < self.STATE_INTERVAL:
+            return
+        self._checked = now
+        try:
+            changes = self.lockin.checkState()
+        except:
+            print("Could not check the lock-in configuration")
+            return
+        for quantity, (old, new) in changes.items():
+            print(f"Warning: the lock-in {quantity} changed from {old} to {new} during the scan")
+            self.lockin_changes.append({'time': tm.strftime('%Y-%m-%dT%H:%M:%S'), 'quantity': quantity, 'old': old, 'new': new})
+        
+    def _channels(self):
+        """ Returns the lock-in quantities of each point: X first, then the other requested SNAP? quantities """
+        requested = [channel.strip() for channel in str(self.parameters.mandatory.channels.value).split(',') if channel.strip()]
+        unknown   = [channel for channel in requested if channel not in self.lockin.SNAP_LIST]
+        if unknown:
+            print(f"Ignored the unknown lock-in channels {unknown}, valid ones are {list(self.lockin.SNAP_LIST)}")
+        channels = ['X'] + [channel for channel in dict.fromkeys(requested) if channel != 'X' and channel not in unknown]
+        if len(channels) > self.lockin.SNAP_MAX:
+            print(f"Only the first {self.lockin.SNAP_MAX} lock-in channels can be read at once: {channels[:self.lockin.SNAP_MAX]}")
+        return tuple(channels[:self.lockin.SNAP_MAX])
+        
+    def _read(self, channels):
+        """ Reads X alone, or all the channels at the same instant in one SNAP? query """
+        return (self.lockin.X(),) if len(channels) == 1 else self.lockin.snap(channels)
+        
+    def _plotDue(self, plot_rate):
+        """ True at most plot_rate times per second, so that fast scans don't flood the GUI event loop """
+        now = tm.perf_counter()
+        if now - self._plotted < 1 / plot_rate:
+            return False
+        self._plotted = now
+        if self.timer.enabled and now - self._timed > self.TIMING_INTERVAL:
+            self._timed = now
+            self.signals.timed.emit(self.timer.summary())
+        return True
+        
+    def _emitRange(self, start, stop, pos, X):
+        """ Sends the points acquired in [start, stop) to the plot and returns stop """
+        if stop > start:
+            self.signals.updated.emit(start, pos[start:stop], X[start:stop].copy())
+        return stop
+        
+    def adaptiveScan(self, pos, tcons, wait, plot_rate, tol=0):
+        N        = len(pos)
+        X        = np.full(N, np.nan)
+        settle   = np.full(N, np.nan)
+        measured = np.full(N, False)
+        self._openWriter(['pos', 'X', 'settle'], resumable=False)
+        self.signals.cleared.emit(pos)
+        
+        coarse = np.unique(np.r_[np.arange(0, N, self.ADAPTIVE_COARSE), N - 1])
+        self._adaptivePass(coarse, pos, X, settle, measured, tcons, wait, plot_rate, tol)
+        
+        if not self.break_:
+            fine = self._refinementIndices(coarse, X[coarse])
+            # the stage ends the coarse pass at the far end, so refill on the way back
+            self._adaptivePass(fine[::-1], pos, X, settle, measured, tcons, wait, plot_rate, tol)
+        
+        self.signals.updated.emit(0, pos[measured], X[measured])
+        print(f"Adaptive scan measured {measured.sum()} of {N} points")
+        
+        return {'pos': pos[measured], 'X': X[measured], 'settle': settle[measured]}
+        
+    def _adaptivePass(self, indices, pos, X, settle, measured, tcons, wait, plot_rate, tol):
+        timer = self.timer
+        timer.start()
+        for n, i in enumerate(indices):
+            self.thz_dl.moveTo(pos[i])
+            timer.lap('move')
+            settle[i] = self._settle(tcons, wait * tcons, tol)
+            timer.lap('settle')
+            X[i] = self.lockin.X()
+            timer.lap('read')
+            measured[i] = True
+            self.writer.append(pos[i], X[i], settle[i])
+            timer.lap('save')
+            if self._plotDue(plot_rate):
+                # the sorted points move around as the gaps are refilled, so the whole set is sent
+                self.signals.updated.emit(0, pos[measured], X[measured])
+            timer.lap('emit')
+            self._checkState()
+            timer.lap('check')
+                
+            if self.break_:
+                break
+                
+    def _refinementIndices(self, coarse, X):
+        """ Returns the fine grid indices lying next to coarse points whose signal or curvature stands out
+        of the noise, estimated from the median absolute deviation so that the pulse itself does not count """
+        if len(coarse) < 3:
+            return np.setdiff1d(np.arange(coarse[-1] + 1), coarse)
+        curvature = np.diff(X, 2, prepend=X[0], append=X[-1])
+        flagged   = self._outliers(X) | self._outliers(curvature)
+        
+        fine = set()
+        for k in np.flatnonzero(flagged):
+            low, high = max(k - self.ADAPTIVE_MARGIN, 0), min(k + self.ADAPTIVE_MARGIN, len(coarse) - 1)
+            fine.update(range(coarse[low], coarse[high] + 1))
+        return np.array(sorted(fine - set(coarse)), dtype=int)
+        
+    def _outliers(self, values):
+        """ Flags the values further than ADAPTIVE_THRESHOLD standard deviations from the median """
+        deviation = np.abs(values - np.median(values))
+        return deviation > self.ADAPTIVE_THRESHOLD * 1.4826 * np.median(deviation)   # 1.4826 MAD = std of a normal noise
+        
+    def averageScan(self, delay_line, pos, repeat, tcons, wait, plot_rate, tol=0, keep_raw=False):
+        N    = len(pos)
+        n    = np.zeros(N)
+        mean = np.zeros(N)
+        M2   = np.zeros(N)
+        raw  = np.full((repeat, N), np.nan)
+        raw_settle = np.full((repeat, N), np.nan)
+        writer, rows = self._openWriter(['rep', 'pos', 'X', 'settle'])
+        self.signals.cleared.emit(pos)
+        low, high = N, -1
+        timer     = self.timer
+        timer.start()
+        
+        # even repetitions sweep forwards, odd ones backwards from where the previous one ended
+        for k, (rep, i) in enumerate(self._serpentine(repeat, N)):
+            if k < len(rows):
+                raw[rep, i], raw_settle[rep, i] = rows['X'][k], rows['settle'][k]
+            else:
+                if rep > 0 and k % N == 0:
+                    self._updateTemperature()
+                try:
+                    delay_line.moveTo(pos[i])
+                    timer.lap('move')
+                    raw_settle[rep, i] = self._settle(tcons, wait * tcons, tol)
+                    timer.lap('settle')
+                    raw[rep, i] = self.lockin.X()
+                    timer.lap('read')
+                except:
+                    print(f"{delay_line.name} error at {pos[i]}mm")
+                writer.append(rep, pos[i], raw[rep, i], raw_settle[rep, i])
+                timer.lap('save')
+            
+            if not np.isnan(raw[rep, i]):
+                # Welford's running mean and sum of squared deviations
+                n[i]    += 1
+                delta    = raw[rep, i] - mean[i]
+                mean[i] += delta / n[i]
+                M2[i]   += delta * (raw[rep, i] - mean[i])
+            low, high = min(low, i), max(high, i)
+            
+            if k >= len(rows):
+                if self._plotDue(plot_rate):
+                    low, high = self._emitAverage(low, high, pos, n, mean, M2)
+                timer.lap('emit')
+                self._checkState()
+                timer.lap('check')
+                if self.break_:
+                    break
+        
+        self._emitAverage(low, high, pos, n, mean, M2)
+        X, X_err, X_std = self._welfordStats(n, mean, M2)
+        
+        with np.errstate(invalid='ignore'):
+            settle = np.nansum(raw_settle, axis=0) / np.sum(~np.isnan(raw_settle), axis=0)   # mean over the repetitions
+        
+        data = {'pos': pos, 'X': X, 'X_std': X_std, 'N': n, 'settle': settle}
+        if keep_raw:
+            for rep in range(repeat):
+                data[f'X{rep}'] = raw[rep]
+        return data
+        
+    def _emitAverage(self, low, high, pos, n, mean, M2):
+        """ Sends the averages updated in [low, high] to the plot and returns an empty range """
+        if high >= low:
+            X, X_err, _ = self._welfordStats(n[low:high + 1], mean[low:high + 1], M2[low:high + 1])
+            self.signals.averaged.emit(low, pos[low:high + 1], X, X_err)
+        return len(pos), -1
+        
+    @staticmethod
+    def _welfordStats(n, mean, M2):
+        """ Returns the mean, its standard error and the sample standard deviation (NaN where undefined) """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            X   = np.where(n > 0, mean, np.nan)
+            std = np.where(n > 1, np.sqrt(M2 / (n - 1)), np.nan)
+            return X, std / np.sqrt(n), std
+        
+    def gridScan(self, thz_pos, pmp_pos, tcons, wait, plot_rate, tol=0):
+        X      = np.full((len(pmp_pos), len(thz_pos)), np.nan)
+        settle = np.full((len(pmp_pos), len(thz_pos)), np.nan)
+        writer, rows = self._openWriter(['pmp', 'thz', 'X', 'settle'])
+        self.signals.gridCleared.emit(thz_pos, pmp_pos)
+        row     = None
+        skipped = False
+        timer   = self.timer
+        timer.start()
+        
+        # serpentine ordering: odd rows are swept backwards from where the previous row ended
+        for n, (j, i) in enumerate(self._serpentine(len(pmp_pos), len(thz_pos))):
+            if n < len(rows):
+                X[j, i], settle[j, i] = rows['X'][n], rows['settle'][n]
+                continue
+            
+            if j != row:
+                # a new row starts: send the finished one (or all the rows restored on resume)
+                for finished in (range(j) if row is None else [row]):
+                    self.signals.imaged.emit(finished, X[finished].copy())
+                row = j
+                try:
+                    self.pmp_dl.moveTo(pmp_pos[j])
+                    skipped = False
+                except:
+                    print(f"Pump delay-line error at {pmp_pos[j]}mm, the row is skipped")
+                    skipped = True
+                    
+            if skipped:
+                # the pump is not at pmp_pos[j]: the row stays NaN, still written so that a resume stays aligned
+                writer.append(pmp_pos[j], thz_pos[i], X[j, i], settle[j, i])
+            else:
+                # the pump move of a new row is charged to the THz move that follows it
+                self.thz_dl.moveTo(thz_pos[i])
+                timer.lap('move')
+                settle[j, i] = self._settle(tcons, wait * tcons, tol)
+                timer.lap('settle')
+                X[j, i] = self.lockin.X()
+                timer.lap('read')
+                writer.append(pmp_pos[j], thz_pos[i], X[j, i], settle[j, i])
+                timer.lap('save')
+                if self._plotDue(plot_rate):
+                    self.signals.imaged.emit(j, X[j].copy())
+                timer.lap('emit')
+                self._checkState()
+                timer.lap('check')
+                
+            if self.break_:
+                break
+                
+        if row is not None:
+            self.signals.imaged.emit(row, X[row].copy())
+        
+        return {'pmp': pmp_pos, 'thz': thz_pos, 'X': X, 'settle': settle}
+        
+    @staticmethod
+    def _serpentine(rows, columns):
+        """ Yields the (row, column) indices of a grid, sweeping odd rows backwards """
+        for j in range(rows):
+            for i in (range(columns) if j % 2 == 0 else range(columns - 1, -1, -1)):
+                yield j, i
+        
+    def flyScan(self, pos, step, vel, tcons):
+        start, end = pos[0], pos[-1]
+        duration   = abs(end - start) / vel
+        rate       = self.lockin.configBuffer(self.FLY_OVERSAMPLING * vel / step)
+        delay      = self.FLY_FILTER_DELAY * self._filterOrder() * tcons   # an n-stage RC filter lags by n tcons
+        
+        if duration * rate > self.lockin.BUFFER_SIZE:
+            print(f"The fly scan exceeds the lock-in buffer, only its first {self.lockin.BUFFER_SIZE / rate:.1f}s will be kept")
+        if vel * tcons > step:
+            print("The THz delay-line moves more than one step per time constant, the waveform will be smeared")
+        
+        track_t, track_p = [], []
+        samples   = np.array([])
+        last_read = 0.0
+        self._openWriter(['t', 'pos', 'X'], resumable=False)
+        self.signals.cleared.emit(pos)
+        
+        self.thz_dl.startPolling(self.FLY_POLLING)
+        self.lockin.startBuffer()
+        t0 = tm.perf_counter()
+        self.thz_dl.startMoveTo(end)
+        
+        while True:
+            t = tm.perf_counter() - t0
+            track_t.append(t)
+            track_p.append(self.thz_dl.getPosition())
+            
+            if self.break_:
+                self.thz_dl.stop()
+                break
+            if t > self.FLY_START_GRACE and not self.thz_dl.isMoving():
+                break
+            if t - last_read > self.FLY_READ_INTERVAL:
+                samples = self._readFlyBlock(samples, rate, delay, track_t, track_p)
+                X = self._rebin(pos, self._samplePositions(np.arange(len(samples)) / rate, delay, track_t, track_p), samples)
+                self.signals.updated.emit(0, pos, X)
+                last_read = t
+                
+            tm.sleep(self.FLY_POLLING / 1000)
+        
+        self.lockin.pauseBuffer()
+        self.thz_dl.stopPolling()
+        samples = self._readFlyBlock(samples, rate, delay, track_t, track_p)
+        X = self._rebin(pos, self._samplePositions(np.arange(len(samples)) / rate, delay, track_t, track_p), samples)
+        self.signals.updated.emit(0, pos, X)
+        
+        return {'pos': pos, 'X': X}
+        
+    def _settle(self, tcons, max_wait, tol):
+        """ Waits at most max_wait seconds, releasing as soon as the residual predicted from the step
+        response of the lock-in filter falls below tol; returns the time actually waited """
+        if not tol:
+            self._stopped.wait(max_wait)
+            return max_wait
+        
+        order    = self._filterOrder()
+        interval = self.SETTLE_INTERVAL * order * tcons
+        t0 = tm.perf_counter()
+        previous, t_previous = self.lockin.X(), t0
+        converged = 0
+        
+        while converged < self.SETTLE_CONFIRM and tm.perf_counter() - t0 + interval < max_wait:
+            if self._stopped.wait(interval):
+                break
+            current, t_current = self.lockin.X(), tm.perf_counter()
+            # the move ends at t0: the change between two readings is the part of the step they saw go by
+            before    = self._filterResidual((t_previous - t0) / tcons, order)
+            remaining = self._filterResidual((t_current - t0) / tcons, order)
+            residual  = abs(current - previous) * remaining / (before - remaining) if before > remaining else np.inf
+            converged = converged + 1 if residual < tol else 0
+            previous, t_previous = current, t_current
+            
+        if converged < self.SETTLE_CONFIRM:
+            self._stopped.wait(max(0.0, max_wait - (tm.perf_counter() - t0)))
+        return tm.perf_counter() - t0
+        
+    def _filterOrder(self):
+        """ Number of RC stages of the lock-in output filter, one per 6 dB/oct of slope """
+        return self.lockin.slope() // 6
+        
+    @staticmethod
+    def _filterResidual(u, order):
+        """ Fraction of a step still to come u time constants after it, at the output of order RC stages """
+        term = total = 1.0
+        for k in range(1, order):
+            term  *= u / k
+            total += term
+        return np.exp(-u) * total
+        
+    def _readFlyBlock(self, samples, rate, delay, track_t, track_p):
+        """ Reads the new buffer points, streams them to disk and returns all the samples so far """
+        block = self.lockin.readBuffer(1, len(samples))
+        t     = np.arange(len(samples), len(samples) + len(block)) / rate
+        self.writer.extend({'t': t, 'pos': self._samplePositions(t, delay, track_t, track_p), 'X': block})
+        return np.append(samples, block)
+        
+    @staticmethod
+    def _samplePositions(t, delay, track_t, track_p):
+        """ Stage positions of the samples taken at t, whose filtered signal left the stage delay seconds earlier """
+        return np.interp(t - delay, track_t, track_p)
+        
+    @staticmethod
+    def _rebin(grid, positions, values):
+        ascending = np.sort(grid)
+        half_step = abs(grid[1] - grid[0]) / 2
+        inside    = (positions >= ascending[0] - half_step) & (positions <= ascending[-1] + half_step)
+        
+        index  = np.searchsorted((ascending[1:] + ascending[:-1]) / 2, positions[inside])
+        counts = np.bincount(index, minlength=len(grid))
+        sums   = np.bincount(index, weights=values[inside], minlength=len(grid))
+        
+        binned = np.full(len(grid), np.nan)
+        binned[counts > 0] = sums[counts > 0] / counts[counts > 0]
+        return binned if grid[0] <= grid[-1] else binned[::-1]
 
         
     @pyqtSlot()
     def setBreak(self, state):
-       self.break_ = state
+        """ Stopping takes effect at once: the waits are cut short and the moves in progress interrupted """
+        self.break_ = state
+        if state:
+            self._stopped.set()
+            # a stage stop waits for the deceleration, which must not freeze the window
+            threading.Thread(target=self._haltStages, name="Stop", daemon=True).start()
+        else:
+            self._stopped.clear()
+            
+    def _haltStages(self):
+        # stop() is not serialized, it reaches the stage while the scan thread waits for its move
+        for delay_line in (self.thz_dl, self.pmp_dl):
+            if not self._stopped.is_set():
+                return   # a new scan started meanwhile
+            if hasattr(delay_line, 'stop'):
+                try:
+                    delay_line.stop()
+                except:
+                    print(f"Could not stop the {delay_line.name}")
+                    
+    def _reportPositions(self):
+        for delay_line in (self.thz_dl, self.pmp_dl):
+            if hasattr(delay_line, 'currentPosition'):
+                try:
+                    print(f"{delay_line.name} stopped at {delay_line.currentPosition():.4f}mm")
+                except:
+                    print(f"Could not read the {delay_line.name} position")
     @pyqtSlot()
-    def run(self):
+    def run(self, checkpoint=None):
+        self._resume = checkpoint
         self.setBreak(False)
         pool = QThreadPool.globalInstance()
         worker = MeasurementWorker(self.scan)
-        pool.start(worker)
\ No newline at end of file
+        pool.start(worker)
+    @pyqtSlot()
+    def resume(self):
+        checkpoint = self._loadCheckpoint()
+        if checkpoint is None:
+            print("There is no interrupted scan to resume")
+            self.signals.finished.emit()
+            return
+        # the hidden values come from the lock-in and Cernox as they are now, read by the Set button
+        self.parameters.restore({group: values for group, values in checkpoint['parameters'].items() if group != 'hidden'})
+        self.run(checkpoint)
\ No newline at end of file
@@ -22,9 +22,12 @@ class Parameters:
     def table(self): return concat([self.mandatory.table, self.info.table, self.hidden.table])
     @property
     def are_valid(self): return all(p.all_values_are_filled for p in (self.mandatory, self.hidden, self.unsavable))
+    @property
+    def groups(self): return {'mandatory': self.mandatory, 'info': self.info, 'hidden': self.hidden, 'unsavable': self.unsavable}
     
     def retrieveHiddenParams(self):
         try:
+            self.lockin.refreshState()   # the settings may have been changed on the front panel
             self.hidden.sens.setValue(self.lockin.sens())
             self.hidden.tcons.setValue(self.lockin.tcons())
             self.hidden.freq.setValue(self.lockin.freq())
@@ -32,18 +35,34 @@ class Parameters:
         except:
             print("Could not retrieve hidden parameters")
             
-    def updateTemperature(self):
+    def updateTemperature(self, value=None):
+        """ Sets the temperature to a logged value, or reads it from the Cernox when there is none """
         try:
-            self.hidden.temp.setValue(self.cernox.temperature())
+            self.hidden.temp.setValue(self.cernox.temperature() if value is None else round(float(value), 1))
         except:
             print("Could not update the temperature value")
     
+    def snapshot(self):
+        """ Returns all the parameter values as a JSON-friendly dict of groups """
+        snapshot = {}
+        for name, group in self.groups.items():
+            values = {param: group.dictionary[param].value for param in group.dictionary}
+            snapshot[name] = {param: value if isinstance(value, bool) else str(value) for param, value in values.items()}
+        return snapshot
+        
+    def restore(self, snapshot):
+        for name, values in snapshot.items():
+            group = self.groups[name]
+            for param in values:
+                if param in group.dictionary:
+                    group.dictionary[param].setValue(values[param])
+    
     def save(self, folder, file):
         self.table.to_csv(f'{folder}/{file}', sep='\t')
         print(f"Saved parameters to {folder}/{file}")
         
     def savePreset(self):
-        if not os.path.exists(self.PRESET_FOLDER): os.makerdirs(self.PRESET_FOLDER)
+        if not os.path.exists(self.PRESET_FOLDER): os.makedirs(self.PRESET_FOLDER)
         self.save(self.PRESET_FOLDER, self.PRESET_FILE)
         
     def _loadPreset(self):
@@ -118,7 +137,10 @@ class MandatoryParams(ParamGroup):
         self.pmp_vel   = Param("Pump velocity", "mm/s", "", 0.0, 100.0)
         self.pmp_step  = Param("Step size", "mm", "", 0.0, 200.0)
         self.wait      = Param("Wait time", "tcons", "", 0.0, 10.0)
-        self.plot_rate = Param("Plot rate", "pts/f", "", 1, 1000)
+        self.plot_fps  = Param("Plot rate", "fps", "10", 1, 1000)   # was plot_rate, in points per update: its preset values are not reused
+        self.mode      = Param("Scan mode", "", "step")
+        self.settle    = Param("Settle tol", "%sens", "0", 0.0, 100.0)
+        self.channels  = Param("Channels", "", "X")
         
         
 class InfoParams(ParamGroup):
@@ -139,7 +161,11 @@ class InfoParams(ParamGroup):
         
 class UnsavableParams(ParamGroup):
     def __init__(self):
-        self.repeat = Param("Repeat", "x", "1", 1, 1000)
+        self.repeat    = Param("Repeat", "x", "1", 1, 1000)
+        self.average   = Param("Average", "", False)
+        self.keep_raw  = Param("Keep raw", "", False)
+        self.timing    = Param("Timing", "", False)
+        self.temp_rate = Param("T rate", "Hz", "1", 0.01, 10.0)
         
     
 class Param:
@@ -0,0 +1,207 @@
+import os
+import json
+import time as tm
+import threading
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+class ScanQueue:
+    """ Runs a series of scan recipes back-to-back without the GUI. A recipe file (JSON, or YAML when
+    PyYAML is installed) holds either a list of recipes or {'defaults': {...}, 'scans': [...]}; each
+    recipe is a dict of parameter values overriding the preset, with an optional 'name':
+        {"defaults": {"user": "night", "thz_step": 0.01},
+         "scans": [{"name": "ref", "sample": "ref", "thz_start": 10, "thz_end": 20}, ...]} """
+    GROUPS     = ('mandatory', 'info', 'unsavable')
+    LOG_FOLDER = './output/queue'
+
+    def __init__(self, measurement, recipes=None):
+        self.measurement = measurement
+        self.parameters  = measurement.parameters
+        self.recipes     = list(recipes or [])
+        self.baseline    = self.parameters.snapshot()   # preset values, restored before each recipe
+        self._log        = None
+
+    @staticmethod
+    def load(path):
+        """ Returns the recipes of a JSON or YAML file, the defaults merged into each of them """
+        with open(path) as file:
+            if path.endswith(('.yaml', '.yml')):
+                if yaml is None:
+                    raise ImportError("PyYAML is required to read YAML recipes, use JSON otherwise")
+                content = yaml.safe_load(file)
+            else:
+                content = json.load(file)
+        if isinstance(content, list):
+            content = {'scans': content}
+        defaults = content.get('defaults', {})
+        return [{**defaults, **recipe} for recipe in content.get('scans', [])]
+
+    def validate(self):
+        """ Returns the problems of all the recipes, so that a queue fails before the night, not during it """
+        errors = []
+        for k, recipe in enumerate(self.recipes):
+            for param, value in recipe.items():
+                if param == 'name':
+                    continue
+                target = self._param(param)
+                if target is None:
+                    errors.append(f"{self.label(k)}: unknown parameter '{param}'")
+                elif isinstance(target.value, bool):
+                    if not isinstance(value, bool):
+                        errors.append(f"{self.label(k)}: {param} = {value} is not true or false")
+                elif param == 'mode':
+                    if value not in self.measurement.MODES:
+                        errors.append(f"{self.label(k)}: mode = {value} is not one of {list(self.measurement.MODES)}")
+                elif param == 'channels':
+                    requested = [channel.strip() for channel in str(value).split(',') if channel.strip()]
+                    unknown   = [channel for channel in requested if channel not in self.measurement.lockin.SNAP_LIST]
+                    if unknown:
+                        errors.append(f"{self.label(k)}: unknown lock-in channels {unknown}")
+                elif target.min_value is not None and target.max_value is not None:
+                    try:
+                        if not target.min_value <= float(value) <= target.max_value:
+                            errors.append(f"{self.label(k)}: {param} = {value} out of [{target.min_value}, {target.max_value}]")
+                    except (TypeError, ValueError):
+                        errors.append(f"{self.label(k)}: {param} = {value} is not a number")
+        return errors
+
+    def order(self, thz_position=0.0, pmp_position=0.0):
+        """ Reorders the recipes to shorten the travel between them: each next recipe is the one whose
+        start is reached first from where the previous one ended, both delay-lines returning at once """
+        pending, ordered = list(self.recipes), []
+        while pending:
+            nearest = min(pending, key=lambda recipe: self._travel((thz_position, pmp_position), self.start(recipe)))
+            pending.remove(nearest)
+            ordered.append(nearest)
+            thz_position, pmp_position = self.end(nearest)
+        self.recipes = ordered
+        return ordered
+
+    def travelTime(self, thz_position=0.0, pmp_position=0.0):
+        """ Estimated time (s) spent returning between the recipes in their current order """
+        total = 0.0
+        for recipe in self.recipes:
+            total += self._travel((thz_position, pmp_position), self.start(recipe))
+            thz_position, pmp_position = self.end(recipe)
+        return total
+
+    def run(self):
+        """ Runs the recipes in order and returns the number of complete scans. Ctrl+C stops the scan in
+        progress and the queue, as does a failed scan: the next scan would overwrite its checkpoint, so
+        that it stays resumable from the GUI """
+        os.makedirs(self.LOG_FOLDER, exist_ok=True)
+        self._log = f"{self.LOG_FOLDER}/{tm.strftime('%Y%m%d-%H%M%S')}.log"
+        complete, t0 = 0, tm.perf_counter()
+        self.log(f"Queue of {len(self.recipes)} scans, about {self.travelTime():.0f} s of delay-line travel between them")
+
+        for k, recipe in enumerate(self.recipes):
+            self.apply(recipe)
+            if not self.parameters.are_valid:
+                self.log(f"{self.label(k)}: skipped, some parameters are missing")
+                continue
+            self.log(f"{self.label(k)}: started")
+            started = tm.perf_counter()
+            status  = self._scan()
+            saved   = ', '.join(os.path.basename(path) for path in self.measurement.saved) or "nothing saved"
+            if status != 'completed':
+                self.log(f"{self.label(k)}: {status} after {tm.perf_counter() - started:.0f} s ({saved}), the queue is interrupted")
+                break
+            complete += 1
+            elapsed   = tm.perf_counter() - t0
+            remaining = elapsed / (k + 1) * (len(self.recipes) - k - 1)
+            self.log(f"{self.label(k)}: completed in {tm.perf_counter() - started:.0f} s ({saved}); "
+                     f"{k + 1}/{len(self.recipes)} done, about {remaining / 60:.0f} min left")
+
+        self.log(f"Queue finished: {complete}/{len(self.recipes)} complete scans in {(tm.perf_counter() - t0) / 60:.1f} min")
+        return complete
+
+    def apply(self, recipe):
+        self.parameters.restore(self.baseline)
+        for param, value in recipe.items():
+            target = self._param(param)
+            if target is not None:
+                target.setValue(value if isinstance(target.value, bool) else str(value))
+        self.parameters.retrieveHiddenParams()
+
+    def log(self, message):
+        line = f"{tm.strftime('%Y-%m-%d %H:%M:%S')}  {message}"
+        print(line)
+        if self._log:
+            with open(self._log, 'a') as file:
+                file.write(line + '\n')
+
+    def _scan(self):
+        """ Runs the scan in a thread, so that Ctrl+C reaches the queue instead of the scan; returns
+        its status """
+        self.measurement.setBreak(False)
+        done = threading.Event()   # waited on instead of Thread.join, which Ctrl+C can leave broken
+        def scan():
+            try:
+                self.measurement.scan()
+            finally:
+                done.set()
+        threading.Thread(target=scan, name="Scan").start()
+        try:
+            while not done.wait(0.5):
+                pass
+        except KeyboardInterrupt:
+            self.log("Stopping the scan in progress...")
+            self.measurement.setBreak(True)
+            done.wait()
+        return self.measurement.status or 'failed'   # None if the scan could not even start
+
+    def _param(self, name):
+        for group in self.GROUPS:
+            dictionary = self.parameters.groups[group].dictionary
+            if name in dictionary:
+                return dictionary[name]
+        return None
+
+    def _setting(self, recipe, name):
+        if name in recipe:
+            return recipe[name]
+        return next((self.baseline[group][name] for group in self.GROUPS if name in self.baseline[group]), None)
+
+    def _value(self, recipe, name):
+        return float(self._setting(recipe, name) or 0.0)
+
+    @staticmethod
+    def _points(start, end, step):
+        # as in Measurement.scan
+        return int(abs(end - start) / step) + 1 if step else 1
+
+    def start(self, recipe):
+        return self._value(recipe, 'thz_start'), self._value(recipe, 'pmp_start')
+
+    def end(self, recipe):
+        """ Where the recipe leaves the delay-lines: back at the THz start after a serpentine grid of an
+        even number of rows, or at the start after an averaged scan of an even number of sweeps. An adaptive
+        scan refills its flagged regions on the way back and stops next to the first one, which is only
+        known once the coarse pass is done: its THz end is given as the (start, end) range it lies in """
+        thz_start, pmp_start = self.start(recipe)
+        thz_end,   pmp_end   = self._value(recipe, 'thz_end'), self._value(recipe, 'pmp_end')
+        thz_N  = self._points(thz_start, thz_end, self._value(recipe, 'thz_step'))
+        pmp_N  = self._points(pmp_start, pmp_end, self._value(recipe, 'pmp_step'))
+        repeat = int(self._value(recipe, 'repeat'))
+
+        if thz_N != 1 and pmp_N != 1:
+            return (thz_start if pmp_N % 2 == 0 else thz_end), pmp_end
+        if thz_N != 1 and self._setting(recipe, 'mode') == 'adaptive':
+            return (thz_start, thz_end), pmp_end
+        average = self._setting(recipe, 'average') is True and repeat > 1 and self._setting(recipe, 'mode') == 'step' and (thz_N == 1) != (pmp_N == 1)
+        if average and repeat % 2 == 0:
+            return thz_start, pmp_start
+        return thz_end, pmp_end
+
+    def _travel(self, origin, target):
+        """ Return time from origin to target; an origin known only as a range counts from its farther end """
+        distance = lambda a, b: max(abs(x - b) for x in a) if isinstance(a, tuple) else abs(a - b)
+        return max(distance(a, b) for a, b in zip(origin, target)) / self.measurement.RETURN_VELOCITY
+
+    def label(self, k):
+        name = self.recipes[k].get('name')
+        return f"[{k + 1}/{len(self.recipes)}]" + (f" {name}" if name else "")
\ No newline at end of file
@@ -0,0 +1,109 @@
+import numpy as np
+from .measurement import Convert
+
+
+class IncrementalSpectrum:
+    WINDOWS         = ('none', 'hann', 'blackman')
+    PADDINGS        = (1, 2, 4, 8)
+    PASSES          = 2      # the beam travels twice the delay-line displacement
+    MAX_FREQUENCY   = 10     # THz, top of the displayed band, beyond the pulse content; bounds the cost of every new point
+    BLOCK_SIZE      = 256    # points per matrix product, bounds the memory of large updates
+
+    def __init__(self, window='hann', padding=2):
+        self._window  = window
+        self._padding = padding
+        self.reset(np.zeros(0))
+
+    @property
+    def window(self): return self._window
+    @property
+    def padding(self): return self._padding
+    @property
+    def frequencies(self): return self._f
+    @property
+    def amplitude(self): return np.abs(self._S)
+
+    def reset(self, pos):
+        """ Prepares the frequency grid of a scan over the delay-line positions pos (mm) """
+        self._pos  = pos
+        self._t0   = Convert.mm_to_ps(self.PASSES * np.min(pos)) if len(pos) else 0.0
+        self._span = Convert.mm_to_ps(self.PASSES * np.ptp(pos)) if len(pos) > 1 else 0.0
+        self._x    = np.full(len(pos), np.nan)
+        self._y    = np.full(len(pos), np.nan)
+        self._grid()
+
+    def _grid(self):
+        # frequencies in THz, the bins of an FFT of the scan zero-padded to padding*N points, up to the Nyquist
+        # frequency of the scan step or MAX_FREQUENCY: the band is cut rather than the resolution
+        N  = len(self._pos)
+        df = (N - 1) / self._span / (self.padding * N) if self._span else 0.0
+        n  = min(self.padding * N // 2, int(self.MAX_FREQUENCY / df)) + 1 if self._span else 0
+        self._f = np.arange(n) * df
+        self._S = np.zeros(n, dtype=complex)
+        # points already in the spectrum, compared with the received ones at each compute
+        self._done_x = np.full(N, np.nan)
+        self._done_y = np.full(N, np.nan)
+
+    def setOptions(self, window=None, padding=None):
+        """ Changes the window or zero-padding; the next compute recomputes the whole spectrum """
+        self._window  = window or self._window
+        self._padding = padding or self._padding
+        self._grid()
+
+    def update(self, start, x, y):
+        """ Writes the points x, y at start; the spectrum follows at the next compute """
+        self._x[start:start + len(x)], self._y[start:start + len(x)] = x, y
+
+    def compute(self):
+        """ Brings the spectrum up to date with the points received since the last call. On the scan grid,
+        only the changed points are added to the running DFT, a point moved or rewritten (averaging) having its
+        previous contribution removed. Off the grid (adaptive points sent sorted, which shift at every refill),
+        or when a plain FFT is cheaper, the whole spectrum is recomputed by FFT """
+        if not len(self._f):
+            return
+        old_x, old_y = self._done_x, self._done_y
+        same    = lambda old, new: (old == new) | (np.isnan(old) & np.isnan(new))
+        changed = ~(same(old_x, self._x) & same(old_y, self._y))
+        count   = np.count_nonzero(changed)
+        if not count:
+            return
+
+        valid   = ~np.isnan(self._x) & ~np.isnan(self._y)
+        on_grid = np.array_equal(self._x[valid], self._pos[valid])
+        if not on_grid or count * len(self._f) > len(self._pos) * np.log2(len(self._pos)):
+            self._S = self._fft(valid, on_grid)
+        else:
+            old = ~np.isnan(old_x[changed]) & ~np.isnan(old_y[changed])
+            new = valid[changed]
+            t   = np.r_[old_x[changed][old], self._x[changed][new]]
+            v   = np.r_[-old_y[changed][old], self._y[changed][new]]
+
+            t = Convert.mm_to_ps(self.PASSES * t) - self._t0
+            v = v * self._windowAt(t)
+            for k in range(0, len(t), self.BLOCK_SIZE):
+                block = slice(k, k + self.BLOCK_SIZE)
+                self._S += v[block] @ np.exp(-2j * np.pi * np.outer(t[block], self._f))
+        self._done_x, self._done_y = self._x.copy(), self._y.copy()
+
+    def _fft(self, valid, on_grid):
+        """ Spectrum of the points placed on the evenly spaced delays of the scan, or interpolated onto them """
+        N  = len(self._pos)
+        dt = self._span / (N - 1)
+        t  = Convert.mm_to_ps(self.PASSES * self._x[valid]) - self._t0
+        v  = np.zeros(N)
+        if on_grid:
+            v[np.rint(t / dt).astype(int)] = self._y[valid]
+        elif np.count_nonzero(valid) > 1:
+            order = np.argsort(t)
+            v = np.interp(np.arange(N) * dt, t[order], self._y[valid][order], left=0, right=0)
+        v = v * self._windowAt(np.arange(N) * dt)
+
+        return np.fft.rfft(v, self.padding * N)[:len(self._f)]
+
+    def _windowAt(self, t):
+        u = t / self._span
+        if self.window == 'hann':
+            return 0.5 - 0.5 * np.cos(2 * np.pi * u)
+        if self.window == 'blackman':
+            return 0.42 - 0.5 * np.cos(2 * np.pi * u) + 0.08 * np.cos(4 * np.pi * u)
+        return np.ones_like(u)
\ No newline at end of file
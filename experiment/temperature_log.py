@@ -0,0 +1,91 @@
+import time as tm
+import threading
+import numpy as np
+from pandas import DataFrame
+
+
+class TemperatureLogger:
+    """ Samples the Cernox in a background thread into a timestamped ring buffer, so that the scans
+    take the latest temperature without waiting for a four-wire reading and keep its trace """
+    RATE            = 1.0     # Hz
+    CAPACITY        = 86_400  # samples, one day at 1 Hz
+    DECIMALS        = 3
+    STALE_INTERVALS = 3       # sample intervals after which the latest value is considered lost
+
+    def __init__(self, cernox, rate=RATE, capacity=CAPACITY):
+        self.cernox  = cernox
+        self._rate   = rate
+        self._t      = np.full(capacity, np.nan)
+        self._T      = np.full(capacity, np.nan)
+        self._count  = 0   # samples written since the start, the next one goes to _count % capacity
+        self._lock   = threading.Lock()   # guards the buffer
+        self._stop   = threading.Event()
+        self._wake   = threading.Event()
+        self._thread = None
+        self._failed = False
+
+    @property
+    def rate(self): return self._rate
+    @property
+    def running(self): return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="TemperatureLogger", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self.running:
+            self._thread.join()
+
+    def setRate(self, rate):
+        """ Changes the sampling rate (Hz), applied from the next sample on """
+        self._rate = rate
+        self._wake.set()
+
+    def latest(self):
+        """ Returns the last temperature (K) without blocking, or None if there is no recent sample """
+        with self._lock:
+            if not self._count:
+                return None
+            k = (self._count - 1) % len(self._t)
+            t, T = self._t[k], self._T[k]
+        return T if tm.time() - t <= self.STALE_INTERVALS / self._rate else None
+
+    def trace(self, since=0.0, until=None):
+        """ Returns the samples taken between the since and until timestamps (s since the epoch) in
+        chronological order, as a DataFrame with the time and T (K) columns """
+        with self._lock:
+            capacity = len(self._t)
+            order    = np.arange(max(self._count - capacity, 0), self._count) % capacity
+            t, T     = self._t[order], self._T[order]
+        kept = (t >= since) & (t <= (until if until is not None else np.inf))
+        return DataFrame({'time': t[kept], 'T': T[kept]})
+
+    def sample(self):
+        """ Reads the Cernox now (blocking) and logs the value; returns it, or None if the reading failed """
+        if self.cernox.device is None:
+            return None
+        try:
+            T = self.cernox.temperature(decimals=self.DECIMALS)   # serialized by the Cernox driver
+            self._failed = False
+        except:
+            if not self._failed:
+                print(f"Could not log the {self.cernox.name} temperature")
+            self._failed = True
+            return None
+        with self._lock:
+            k = self._count % len(self._t)
+            self._t[k], self._T[k] = tm.time(), T
+            self._count += 1
+        return T
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._wake.clear()
+            self._wake.wait(1 / self._rate)
\ No newline at end of file
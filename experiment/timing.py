@@ -0,0 +1,79 @@
+import math
+import time as tm
+import numpy as np
+from pandas import DataFrame
+
+
+class Timer:
+    """ Lap timer of the acquisition phases: each lap charges the time since the previous one to a phase,
+    so that a point costs one perf_counter call per phase. Durations are kept as running statistics and
+    a log-spaced histogram, whatever the number of points """
+    MIN_DURATION    = 1e-6   # s, lower edge of the histogram
+    DECADES         = 8      # up to 100 s
+    BINS_PER_DECADE = 10
+
+    enabled = True
+
+    def __init__(self):
+        self._phases = {}   # phase: [count, total, min, max, histogram]
+        self._mark   = tm.perf_counter()
+
+    @property
+    def phases(self): return list(self._phases)
+
+    @classmethod
+    def binEdges(cls):
+        return cls.MIN_DURATION * np.logspace(0, cls.DECADES, cls.DECADES * cls.BINS_PER_DECADE + 1)
+
+    def start(self):
+        self._mark = tm.perf_counter()
+
+    def lap(self, phase):
+        now        = tm.perf_counter()
+        dt         = now - self._mark
+        self._mark = now
+        stats = self._phases.get(phase)
+        if stats is None:
+            stats = self._phases[phase] = [0, 0.0, math.inf, 0.0, [0] * (self.DECADES * self.BINS_PER_DECADE)]
+        stats[0] += 1
+        stats[1] += dt
+        stats[2]  = min(stats[2], dt)
+        stats[3]  = max(stats[3], dt)
+        k = int(math.log10(max(dt, self.MIN_DURATION) / self.MIN_DURATION) * self.BINS_PER_DECADE)
+        stats[4][min(k, len(stats[4]) - 1)] += 1
+
+    def summary(self):
+        """ Returns the statistics of each phase (s), with percentiles estimated from the histogram """
+        edges   = self.binEdges()
+        summary = {}
+        for phase, (count, total, minimum, maximum, histogram) in self._phases.items():
+            cumulative = np.cumsum(histogram) / count
+            summary[phase] = {'count': count, 'total': total, 'mean': total / count, 'min': minimum, 'max': maximum,
+                              **{f'p{q}': edges[np.searchsorted(cumulative, q / 100) + 1] for q in (50, 90, 99)},
+                              'histogram': np.array(histogram)}
+        return summary
+
+    def table(self):
+        """ Returns the summary as a DataFrame, one row per phase, without the histograms """
+        summary = self.summary()
+        return DataFrame({phase: {k: v for k, v in stats.items() if k != 'histogram'} for phase, stats in summary.items()}).T
+
+    def save(self, folder, file):
+        self.table().to_csv(f'{folder}/{file}', sep='\t')
+
+
+class NullTimer:
+    """ Stands for Timer when the timing is off """
+    enabled = False
+
+    @property
+    def phases(self): return []
+
+    def start(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def summary(self):
+        return {}
\ No newline at end of file
@@ -0,0 +1,112 @@
+import os
+import glob
+import shutil
+import time as tm
+from pandas import DataFrame, read_table
+
+
+class ScanWriter:
+    PARTIAL_SUFFIX = '.part'
+    CHUNK_SIZE     = 256   # rows kept in memory before they are flushed to disk
+    FLUSH_INTERVAL = 10    # s, maximum time a row waits in memory
+
+    def __init__(self, path, columns, chunk_size=CHUNK_SIZE, append=False):
+        self._path       = path
+        self._columns    = list(columns)
+        self._chunk_size = chunk_size
+        self._rows       = []
+        self._count      = 0
+        self._last_flush = tm.perf_counter()
+
+        if append and os.path.exists(self.partial_path):
+            self._count = self._dropIncompleteLine(self.partial_path)
+            self._file  = open(self.partial_path, 'a', newline='')
+        else:
+            self._file  = open(self.partial_path, 'w', newline='')
+            self._file.write('\t'.join(self.columns) + '\n')
+        self._sync()
+
+    @property
+    def path(self): return self._path
+    @property
+    def partial_path(self): return self._path + self.PARTIAL_SUFFIX
+    @property
+    def columns(self): return self._columns
+    @property
+    def count(self): return self._count + len(self._rows)
+    @property
+    def closed(self): return self._file.closed
+
+    def append(self, *values):
+        self._rows.append(values)
+        if len(self._rows) >= self._chunk_size or tm.perf_counter() - self._last_flush > self.FLUSH_INTERVAL:
+            self.flush()
+
+    def extend(self, block):
+        """ Appends a block of rows, given as a dict of columns or a DataFrame """
+        self.flush()
+        block = DataFrame(block, columns=self.columns)
+        block.to_csv(self._file, sep='\t', header=False, index=False)
+        self._count += len(block)
+        self._sync()
+
+    def flush(self):
+        if self._rows:
+            DataFrame(self._rows, columns=self.columns).to_csv(self._file, sep='\t', header=False, index=False)
+            self._count += len(self._rows)
+            self._rows   = []
+        self._sync()
+
+    def close(self, columns=None, complete=True):
+        """ Writes the final columns (a dict of equally long arrays) to path; the partial file is discarded only if complete """
+        self.flush()
+        self._file.close()
+        if columns is not None:
+            self.write(self.path, columns, self._chunk_size)
+        if complete:
+            os.remove(self.partial_path)
+
+    def finalize(self, complete=True):
+        """ Closes the writer and makes the partial file the final one. An incomplete scan keeps its partial
+        file to be resumed, and the final one is a copy of it """
+        self.flush()
+        self._file.close()
+        if complete:
+            os.replace(self.partial_path, self.path)
+        else:
+            shutil.copyfile(self.partial_path, self.path + '.tmp')
+            os.replace(self.path + '.tmp', self.path)
+
+    @staticmethod
+    def write(path, columns, chunk_size=CHUNK_SIZE):
+        """ Writes a dict of columns as a table, chunk_size rows at a time so that the data is never copied whole """
+        length = len(next(iter(columns.values())))
+        with open(path + '.tmp', 'w', newline='') as file:
+            file.write('\t'.join(str(name) for name in columns) + '\n')
+            for start in range(0, length, chunk_size):
+                chunk = DataFrame({name: values[start:start + chunk_size] for name, values in columns.items()})
+                chunk.to_csv(file, sep='\t', header=False, index=False)
+        os.replace(path + '.tmp', path)
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_flush = tm.perf_counter()
+
+    @staticmethod
+    def _dropIncompleteLine(path):
+        """ Cuts a row left half-written by a crash and returns the number of complete rows """
+        with open(path, 'rb+') as file:
+            content = file.read()
+            file.truncate(content.rfind(b'\n') + 1)
+            return max(content[:content.rfind(b'\n') + 1].count(b'\n') - 1, 0)
+
+    @classmethod
+    def read(cls, path):
+        """ Returns the data of a complete or partial scan file and whether it is complete """
+        complete = not path.endswith(cls.PARTIAL_SUFFIX)
+        return read_table(path), complete
+
+    @classmethod
+    def partialFiles(cls, folder):
+        return sorted(glob.glob(f'{folder}/*{cls.PARTIAL_SUFFIX}'))
\ No newline at end of file
@@ -2,19 +2,37 @@ from PyQt6.QtCore import QObject, pyqtSignal
 import os
 import time as tm
 import sys
-import clr
-from System import String
-from System import Decimal
-from System.Collections import *
+import threading
+from .io_worker import IOWorker, serialized
 
-if not r'C:\Program Files\Thorlabs\Kinesis' in sys.path:
-    sys.path.append(r'C:\Program Files\Thorlabs\Kinesis')
-    
-clr.AddReference("Thorlabs.MotionControl.DeviceManagerCLI")
-from Thorlabs.MotionControl.DeviceManagerCLI import DeviceManagerCLI
+KINESIS_FOLDER = r'C:\Program Files\Thorlabs\Kinesis'
+
+
+class Kinesis:
+    """ The .NET runtime and Kinesis assemblies, loaded on first use since pythonnet is slow to start """
+    DeviceManagerCLI    = None
+    KCubeBrushlessMotor = None
+    Decimal             = None
+
+    _lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        with cls._lock:
+            if cls.DeviceManagerCLI is None:
+                if not KINESIS_FOLDER in sys.path:
+                    sys.path.append(KINESIS_FOLDER)
+                import clr
+                from System import Decimal
+
+                clr.AddReference("Thorlabs.MotionControl.DeviceManagerCLI")
+                from Thorlabs.MotionControl.DeviceManagerCLI import DeviceManagerCLI
+
+                clr.AddReference("Thorlabs.MotionControl.KCube.BrushlessMotorCLI")
+                from Thorlabs.MotionControl.KCube.BrushlessMotorCLI import KCubeBrushlessMotor
 
-clr.AddReference("Thorlabs.MotionControl.KCube.BrushlessMotorCLI")
-from Thorlabs.MotionControl.KCube.BrushlessMotorCLI import KCubeBrushlessMotor
+                cls.DeviceManagerCLI, cls.KCubeBrushlessMotor, cls.Decimal = DeviceManagerCLI, KCubeBrushlessMotor, Decimal
+            return cls
 
 
 class KBD101Signals(QObject):
@@ -26,12 +44,17 @@ class KBD101:
     PRESET_FOLDER = './preset'
     MINIMUM_POSITION = 0.0
     MAXIMUM_POSITION = 100.0
+    BACKEND = None   # replaces both Kinesis.DeviceManagerCLI and Kinesis.KCubeBrushlessMotor, e.g. with the simulator's
+    
+    _lock    = threading.Lock()
+    _serials = None   # (device manager, serials) of the last enumeration
 
     def __init__(self, name="KBD101"):
         self._name    = name
         self._serial  = None
         self._device  = None
         self._signals = KBD101Signals()
+        self._io      = IOWorker(name)
         
     @property
     def name(self): return self._name
@@ -42,6 +65,9 @@ class KBD101:
     @property
     def signals(self): return self._signals
     @property
+    def io(self): return self._io
+    @property
+    @serialized
     def idn(self):
         try:
             device_info = self.device.GetDeviceInfo()
@@ -49,11 +75,17 @@ class KBD101:
         except:
             return ""
     
+    @serialized
     def connect(self):
         if isinstance(self.serial, str) and self.serial[:2] == "28":
-            if self.serial in self.addressList():
+            try:
+                listed = self.serial in self.addressList() or self.serial in self.addressList(refresh=True)
+            except:
+                print(f"Failed to connect the {self.name}: the Kinesis software could not be loaded")
+                return
+            if listed:
                 try:
-                    self._device = KCubeBrushlessMotor.CreateKCubeBrushlessMotor(self.serial)
+                    self._device = (self.BACKEND or Kinesis.load().KCubeBrushlessMotor).CreateKCubeBrushlessMotor(self.serial)
                     self.device.Connect(self.serial)
                     tm.sleep(.2)
                     self.device.LoadMotorConfiguration(self.serial)
@@ -67,6 +99,7 @@ class KBD101:
         else:
             print(f"Failed to connect the {self.name}. Check if the intended serial number is a string that begins with '28'")
             
+    @serialized
     def disconnect(self):
         try:
             self.device.Disconnect()
@@ -79,9 +112,15 @@ class KBD101:
     def setAddress(self, serial):
         self._serial = serial
             
-    def addressList(self):
-        DeviceManagerCLI.BuildDeviceList()
-        return DeviceManagerCLI.GetDeviceList()
+    @classmethod
+    def addressList(cls, refresh=False):
+        """ Builds the Kinesis device list once; the cached serials are returned until refresh is asked for """
+        with cls._lock:
+            manager = cls.BACKEND or Kinesis.load().DeviceManagerCLI
+            if refresh or KBD101._serials is None or KBD101._serials[0] is not manager:
+                manager.BuildDeviceList()
+                KBD101._serials = manager, [str(serial) for serial in manager.GetDeviceList()]
+            return KBD101._serials[1]
         
     def loadPresetAddress(self):
         preset_serial = ""
@@ -103,30 +142,53 @@ class KBD101:
         except:
             print(f"Failed to save {self.name} current serial to preset folder")
             
+    def _decimal(self, value):
+        return value if self.BACKEND else Kinesis.load().Decimal(value)
+
     # DELAY LINE COMMANDS ##################################################################
+    @serialized
     def startPolling(self, rate=50):
         self.device.StartPolling(rate)
         
+    @serialized
     def stopPolling(self):
         self.device.StopPolling()
         
+    @serialized
     def setVelocity(self, velocity, acceleration=999):
-        self.device.SetVelocityParams(Decimal(velocity), Decimal(acceleration))
+        self.device.SetVelocityParams(self._decimal(velocity), self._decimal(acceleration))
         
+    @serialized
     def moveTo(self, position, timeout=60000):
-        self.device.MoveTo(Decimal(float(position)), timeout)
+        self.device.MoveTo(self._decimal(float(position)), timeout)
+        
+    @serialized
+    def startMoveTo(self, position):
+        self.device.MoveTo(self._decimal(float(position)), 0)
+        
+    @serialized
+    def isMoving(self):
+        return bool(self.device.Status.IsInMotion)
+        
+    def stop(self, timeout=60000):
+        """ Not serialized, so that it interrupts a move in progress """
+        self.device.Stop(timeout)
         
+    @serialized
     def returnTo(self, position, timeout=60000):
         self.setVelocity(100)
         self.moveTo(position, timeout)
         
+    @serialized
     def requestPosition(self):
         self.device.RequestPosition()
         
+    @serialized
     def getPosition(self):
         position = str(self.device.Position).replace(',', '.')
         return float(position)
         
+    @serialized
     def currentPosition(self):
         self.requestPosition()
         return self.getPosition()
\ No newline at end of file
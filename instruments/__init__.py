@@ -1,6 +1,29 @@
-from .visa_instrument import VISAInstrument, VISAInstrument_foo
-from .lockin import LockIn
-from .ottime_delayline import OttimeDelayline_foo
-from .multimeter import Multimeter
-from .cernox import Cernox
-from .KBD101 import KBD101
\ No newline at end of file
+from importlib import import_module
+
+# driver registry: name -> module. The drivers are imported on first access, and their heavy runtimes
+# (pyvisa, pythonnet and the Kinesis assemblies, pandas) only when an instrument is first connected or used
+DRIVERS = {
+    'VISAInstrument':      'visa_instrument',
+    'VISAInstrument_foo':  'visa_instrument',
+    'LockIn':              'lockin',
+    'OttimeDelayline':     'ottime_delayline',
+    'OttimeDelayline_foo': 'ottime_delayline',
+    'Multimeter':          'multimeter',
+    'Cernox':              'cernox',
+    'KBD101':              'KBD101',
+    'Simulator':           'simulator',
+}
+
+__all__ = list(DRIVERS)
+
+
+def __getattr__(name):
+    if name not in DRIVERS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    driver = getattr(import_module(f'.{DRIVERS[name]}', __name__), name)
+    globals()[name] = driver
+    return driver
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
\ No newline at end of file
@@ -1,18 +1,22 @@
+import os
 from instruments import Multimeter
 from numpy import interp, around
-from pandas import read_table
 
 
 class Cernox(Multimeter):
-    CALIBRATION_FILE = './instruments/cernox_calibration/table'
+    CALIBRATION_FILE = os.path.join(os.path.dirname(__file__), 'cernox_calibration', 'table')   # read on first use, whatever the working directory
 
     def __init__(self, name="Cernox"):
         super().__init__(name)
         
-        self._calibration = read_table(self.CALIBRATION_FILE)
+        self._calibration = None
         
     @property
-    def calibration(self): return self._calibration
+    def calibration(self):
+        if self._calibration is None:
+            from pandas import read_table   # deferred until the first temperature reading
+            self._calibration = read_table(self.CALIBRATION_FILE)
+        return self._calibration
 
     # Try to implement some sort of temperature conversion...
     def temperature(self, decimals=1):
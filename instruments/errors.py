@@ -0,0 +1,12 @@
+import sys
+
+
+def instrumentErrors():
+    """ Returns the exception types of a failed instrument operation: the link errors (OSError covers
+    the serial and timeout errors), and the VISA and Kinesis .NET exceptions once their runtime is loaded """
+    errors = [OSError]
+    if 'pyvisa' in sys.modules:
+        errors.append(sys.modules['pyvisa'].errors.Error)
+    if 'System' in sys.modules:
+        errors.append(sys.modules['System'].Exception)
+    return tuple(errors)
\ No newline at end of file
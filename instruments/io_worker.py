@@ -0,0 +1,75 @@
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtCore import QObject, pyqtSignal
+
+
+class IOWorker:
+    """ Serializes the access to one instrument session. Asynchronous calls (submit) are queued on a
+    dedicated thread and return a Future; synchronous calls (call) run in the calling thread under the
+    same lock, so that the scan loop pays no thread switch. The lock is reentrant: a driver method may
+    call others, and a submitted task may call the serialized methods """
+    def __init__(self, name):
+        self._name     = name
+        self._lock     = threading.RLock()
+        self._executor = None
+        self._starting = threading.Lock()   # not the instrument lock, held for as long as a move or a reading lasts
+
+    @property
+    def name(self): return self._name
+    @property
+    def lock(self): return self._lock
+
+    def call(self, fn, *args, **kwargs):
+        with self._lock:
+            return fn(*args, **kwargs)
+
+    def submit(self, fn, *args, **kwargs):
+        """ Queues fn on the instrument thread and returns its Future """
+        if self._executor is None:
+            with self._starting:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"IO {self.name}")
+        return self._executor.submit(self.call, fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        with self._starting:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def serialized(method):
+    """ Runs the driver method under the instrument's IOWorker lock, so that the GUI, the scan and the
+    loggers never interleave their commands on the same session """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.io.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class FutureSignals(QObject):
+    finished = pyqtSignal(object)   # result
+    failed   = pyqtSignal(object)   # exception
+
+    def __init__(self, future, finished=None, failed=None):
+        """ Re-emits the outcome of a Future as Qt signals, queued from the instrument thread. A bound
+        method of a QObject runs in the thread of that object, any other slot (lambda, function) in the
+        thread that created this FutureSignals, the GUI thread when built by a widget. The slots are
+        connected before the Future can complete. Keep a reference until it is done """
+        super().__init__()
+        self.future = future
+        if finished is not None:
+            self.finished.connect(finished)
+        if failed is not None:
+            self.failed.connect(failed)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.failed.emit(future.exception())
+        else:
+            self.finished.emit(future.result())
\ No newline at end of file
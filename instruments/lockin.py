@@ -1,7 +1,11 @@
+import numpy as np
 from instruments import VISAInstrument
+from .io_worker import serialized
 
 
 class LockIn(VISAInstrument):
+    RESPONSE_SEPARATOR = None   # the SR830 terminates the response to each query of a batch
+    
     # first col: lock-in index; second col: values in nA (or mV)
     SENS_LIST = {
         '17': 1,
@@ -40,38 +44,285 @@ class LockIn(VISAInstrument):
         '19': 30e3
     }
 
+    # first col: lock-in index; second col: buffer sample rates in Hz
+    SRAT_LIST = {
+        '0':  62.5e-3,
+        '1':  125e-3,
+        '2':  250e-3,
+        '3':  500e-3,
+        '4':  1,
+        '5':  2,
+        '6':  4,
+        '7':  8,
+        '8':  16,
+        '9':  32,
+        '10': 64,
+        '11': 128,
+        '12': 256,
+        '13': 512
+    }
+    BUFFER_SIZE = 16383
+
+    # first col: lock-in index; second col: low pass filter slopes in dB/oct
+    SLOPE_LIST = {
+        '0': 6,
+        '1': 12,
+        '2': 18,
+        '3': 24
+    }
+
+    # first col: lock-in index; second col: dynamic reserve modes
+    RESERVE_LIST = {
+        '0': 'high reserve',
+        '1': 'normal',
+        '2': 'low noise'
+    }
+
+    # first col: lock-in index; second col: input sources
+    INPUT_LIST = {
+        '0': 'A',
+        '1': 'A-B',
+        '2': 'I (1 MOhm)',
+        '3': 'I (100 MOhm)'
+    }
+    # first col: lock-in index; second col: factor converting the SENS_LIST values to the unit of the readings (V or A)
+    SENS_UNITS = {
+        '0': 1e-3,
+        '1': 1e-3,
+        '2': 1e-9,
+        '3': 1e-11
+    }
+
+    # configuration kept in the cache: quantity -> command (queried with '?', set with its value appended)
+    STATE_COMMANDS = {'sens': 'SENS', 'tcons': 'OFLT', 'freq': 'FREQ', 'phase': 'PHAS', 'slope': 'OFSL', 'reserve': 'RMOD', 'input': 'ISRC'}
+    FREQ_TOLERANCE = 0.01   # relative drift of an external reference not reported as a change
+
+    # quantities that can be stored in the buffer of each display channel (DDEF)
+    CH1_LIST = {'X': 0, 'R': 1, 'X noise': 2, 'Aux1': 3, 'Aux2': 4}
+    CH2_LIST = {'Y': 0, 'theta': 1, 'Y noise': 2, 'Aux3': 3, 'Aux4': 4}
+
+    # quantities that can be read at the same instant by one SNAP? query, 2 to 6 at a time
+    SNAP_LIST = {'X': 1, 'Y': 2, 'R': 3, 'theta': 4, 'Aux1': 5, 'Aux2': 6, 'Aux3': 7, 'Aux4': 8, 'freq': 9, 'CH1': 10, 'CH2': 11}
+    SNAP_MAX  = 6
+
     def __init__(self, name="Lock-in"):
         super().__init__(name)
         
+        self._state = {}   # quantity: last raw response, dropped when the setting is written
+        
     @property
+    @serialized
     def idn(self): return self.device.query('*IDN?')
 
+    @serialized
+    def connect(self):
+        self.invalidate()
+        super().connect()
+
+    @serialized
     def XY(self):
         X, Y = self.device.query('SNAP?1,2').split(',')
         return float(X), float(Y)
 
+    @serialized
+    def snap(self, quantities=('X', 'Y')):
+        """ Returns the SNAP_LIST quantities, 2 to 6 of them, read at the same instant in one query """
+        values = self.device.query(f"SNAP?{','.join(str(self.SNAP_LIST[q]) for q in quantities)}").split(',')
+        return tuple(float(value) for value in values)
+
+    @serialized
     def X(self):
         X = self.device.query('OUTP?1')
         return float(X)
 
+    @serialized
     def Y(self):
         Y = self.device.query('OUTP?2')
         return float(Y)
 
     def phase(self):
-        phase = self.device.query('PHAS?')
-        return float(phase)
+        return float(self._cached('phase'))
 
     def freq(self):
-        freq = self.device.query('FREQ?')
-        return float(freq)
+        return float(self._cached('freq'))
 
     def sens(self):
         """ Returns 0 if sensitivity out of range """
-        i = self.device.query('SENS?')
+        i = self._cached('sens')
         return self.SENS_LIST[i] if i in self.SENS_LIST else 0
 
     def tcons(self):
-        i = self.device.query('OFLT?')
-        return self.TCONS_LIST[i]
-    
\ No newline at end of file
+        return self.TCONS_LIST[self._cached('tcons')]
+
+    def slope(self):
+        return self.SLOPE_LIST[self._cached('slope')]
+
+    def reserve(self):
+        return self.RESERVE_LIST[self._cached('reserve')]
+
+    def input(self):
+        return self.INPUT_LIST[self._cached('input')]
+
+    def sensUnit(self):
+        """ Returns the factor converting sens() to V or A, which depends on the input source """
+        return self.SENS_UNITS[self._cached('input')]
+
+    # CONFIGURATION COMMANDS ###############################################################
+    def setSens(self, sens):
+        """ Sets the smallest sensitivity >= sens (nA), or the largest one """
+        self._write('sens', next((i for i in self.SENS_LIST if self.SENS_LIST[i] >= sens), '26'))
+
+    def setTcons(self, tcons):
+        """ Sets the shortest time constant >= tcons (s), or the longest one """
+        self._write('tcons', next((i for i in self.TCONS_LIST if self.TCONS_LIST[i] >= tcons), '19'))
+
+    def setFreq(self, freq):
+        """ Internal reference only """
+        self._write('freq', f'{freq:.4f}')
+
+    def setPhase(self, phase):
+        self._write('phase', f'{phase:.2f}')
+
+    def setSlope(self, slope):
+        self._write('slope', next((i for i in self.SLOPE_LIST if self.SLOPE_LIST[i] >= slope), '3'))
+
+    def setReserve(self, reserve):
+        self._write('reserve', next(i for i in self.RESERVE_LIST if self.RESERVE_LIST[i] == reserve))
+
+    @serialized
+    def state(self):
+        """ Returns the configuration, the quantities not cached being read together in one batch """
+        missing = [quantity for quantity in self.STATE_COMMANDS if quantity not in self._state]
+        if missing:
+            batch = self.batch()
+            for quantity in missing:
+                batch.query(f'{self.STATE_COMMANDS[quantity]}?')
+            self._state.update(zip(missing, batch.send()))
+        return {quantity: getattr(self, quantity)() for quantity in self.STATE_COMMANDS}
+
+    def refreshState(self):
+        """ Reads the whole configuration from the instrument and returns it """
+        self.invalidate()
+        return self.state()
+
+    @serialized
+    def checkState(self):
+        """ Re-reads the configuration and returns the settings changed behind the driver's back
+        (front panel, other software) as quantity: (cached value, new value) """
+        cached  = {quantity: getattr(self, quantity)() for quantity in self._state}
+        current = self.refreshState()
+        changes = {}
+        for quantity, old in cached.items():
+            new = current[quantity]
+            if quantity == 'freq' and abs(new - old) <= self.FREQ_TOLERANCE * abs(old):
+                continue
+            if new != old:
+                changes[quantity] = (old, new)
+        return changes
+
+    def invalidate(self, *quantities):
+        """ Forgets the cached quantities, all of them by default """
+        for quantity in quantities or list(self._state):
+            self._state.pop(quantity, None)
+
+    @serialized
+    def sendBatch(self, commands):
+        """ Batched writes of configuration commands invalidate the cache like the setters """
+        written = [quantity for quantity, command in self.STATE_COMMANDS.items()
+                   if any(parse is None and sent.startswith(command) for sent, parse in commands)]
+        try:
+            return super().sendBatch(commands)
+        finally:
+            if written:
+                self.invalidate(*written)
+
+    @serialized
+    def _cached(self, quantity):
+        raw = self._state.get(quantity)
+        if raw is None:
+            raw = self._state[quantity] = self.device.query(f'{self.STATE_COMMANDS[quantity]}?').strip()
+        return raw
+
+    @serialized
+    def _write(self, quantity, value):
+        self.device.write(f'{self.STATE_COMMANDS[quantity]}{value}')
+        self.invalidate(quantity)
+
+    # DATA BUFFER COMMANDS #################################################################
+    @serialized
+    def setSampleRate(self, rate):
+        """ Sets the slowest buffer sample rate >= rate (Hz), or the fastest one, and returns it """
+        i = next((i for i in self.SRAT_LIST if self.SRAT_LIST[i] >= rate), '13')
+        self.device.write(f'SRAT{i}')
+        return self.SRAT_LIST[i]
+
+    @serialized
+    def setTriggerSampling(self):
+        """ Stores one buffer point per rising edge at the rear panel TRIG IN """
+        self.device.write('SRAT14')
+
+    @serialized
+    def setTriggerStart(self, state):
+        self.device.write(f'TSTR{int(state)}')
+
+    @serialized
+    def setBufferLoop(self, state):
+        """ Loop mode overwrites the oldest points when full, otherwise the buffer stops (one shot) """
+        self.device.write(f'SEND{int(state)}')
+
+    @serialized
+    def setBufferChannels(self, ch1='X', ch2='Y'):
+        self.device.write(f'DDEF1,{self.CH1_LIST[ch1]},0')
+        self.device.write(f'DDEF2,{self.CH2_LIST[ch2]},0')
+
+    @serialized
+    def configBuffer(self, rate, ch1='X', ch2='Y', loop=False, trigger_start=False):
+        """ Resets the buffer and configures it for an acquisition; returns the actual sample rate """
+        self.pauseBuffer()
+        self.setBufferChannels(ch1, ch2)
+        self.setBufferLoop(loop)
+        self.setTriggerStart(trigger_start)
+        if rate == 'trigger':
+            self.setTriggerSampling()
+        else:
+            rate = self.setSampleRate(rate)
+        self.resetBuffer()
+        return rate
+
+    @serialized
+    def startBuffer(self):
+        self.device.write('STRT')
+
+    @serialized
+    def pauseBuffer(self):
+        self.device.write('PAUS')
+
+    @serialized
+    def resetBuffer(self):
+        self.device.write('REST')
+
+    @serialized
+    def bufferSize(self):
+        return int(self.device.query('SPTS?'))
+
+    @serialized
+    def readBuffer(self, channel=1, start=0, count=None, fmt='TRCB'):
+        """ Reads the channel (1 or 2) buffer into an array, in binary (TRCB, TRCL) or ASCII (TRCA) format """
+        count = self.bufferSize() - start if count is None else count
+        if count <= 0:
+            return np.array([])
+        if fmt == 'TRCA':
+            values = self.device.query(f'TRCA?{channel},{start},{count}')
+            return np.array(values.strip(',').split(','), dtype=float)
+        
+        self.device.write(f'{fmt}?{channel},{start},{count}')
+        raw = self.device.read_bytes(4 * count)
+        if fmt == 'TRCL':
+            mantissa, exponent = np.frombuffer(raw, dtype='<i2').reshape(-1, 2).T
+            return mantissa * 2.0 ** (exponent.astype(float) - 124)
+        return np.frombuffer(raw, dtype='<f4').astype(float)
+
+    @serialized
+    def readBuffers(self, start=0, count=None, fmt='TRCB'):
+        count = self.bufferSize() - start if count is None else count
+        return self.readBuffer(1, start, count, fmt), self.readBuffer(2, start, count, fmt)
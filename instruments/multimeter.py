@@ -1,25 +1,36 @@
 from instruments import VISAInstrument
+from .io_worker import serialized
 
 
 class Multimeter(VISAInstrument):
     def __init__(self, name="Multimeter"):
         super().__init__(name)
         
+    def _join(self, commands):
+        """ A SCPI command after ';' is read relative to the header path of the previous one, so each
+        batched command restarts from the root with ':' (the common '*' commands ignore the path) """
+        return ';'.join(command if command.startswith(('*', ':')) else f':{command}' for command in commands)
+        
     @property
+    @serialized
     def idn(self): return self.device.query('*IDN?')
 
+    @serialized
     def volt(self):
         volt = self.device.query('MEAS?')
         return float(volt)
 
+    @serialized
     def curr(self):
         curr = self.device.query('MEAS:CURR?')
         return float(curr)
 
+    @serialized
     def fres(self):
         fres = self.device.query('MEAS:FRES?')
         return float(fres)
 
+    @serialized
     def res(self):
         res = self.device.query('MEAS:RES?')
         return float(res)
\ No newline at end of file
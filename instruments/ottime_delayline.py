@@ -1,4 +1,5 @@
 from instruments import VISAInstrument, VISAInstrument_foo
+from .io_worker import serialized
 
 
 class OttimeDelayline(VISAInstrument):
@@ -6,6 +7,7 @@ class OttimeDelayline(VISAInstrument):
     MAXIMUM_POSITION  = 200.0
     READ_TERMINATION  = '\r\n'
     WRITE_TERMINATION = '\r\n'
+    COMMAND_SEPARATOR = None   # one command per message
     
     def __init__(self, name="Ottime Delay-line"):
         super().__init__(name)
@@ -20,6 +22,7 @@ class OttimeDelayline(VISAInstrument):
     def setVelocity(self, velocity):
         self._velocity = velocity
         
+    @serialized
     def moveTo(self, position):
         self.device.query(f'@0M{position},{self.velocity}')
         
@@ -27,6 +30,7 @@ class OttimeDelayline(VISAInstrument):
         self.setVelocity(100)
         self.moveTo(position)
         
+    @serialized
     def home(self):
         self.device.query('@0R1')
 
@@ -50,6 +54,7 @@ class OttimeDelayline_foo(VISAInstrument_foo):
     def setVelocity(self, velocity):
         self._velocity = velocity
         
+    @serialized
     def moveTo(self, position):
         print('"Moved" the empty delay line')
         #self.device.query(f'@0M{position},{self.velocity}')
@@ -58,6 +63,7 @@ class OttimeDelayline_foo(VISAInstrument_foo):
         self.setVelocity(100)
         self.moveTo(position)
         
+    @serialized
     def home(self):
         print('The empty delay line "found" the home')
         #self.device.query('@0R1')
\ No newline at end of file
@@ -0,0 +1,481 @@
+import time as tm
+import numpy as np
+from .visa_instrument import VISAInstrument
+from .lockin import LockIn
+from .cernox import Cernox
+from instruments import KBD101   # through the registry, as .KBD101 would rebind instruments.KBD101 to the module
+
+
+class Simulator:
+    """ Hardware-free bench: replaces the VISA resources (SR830, DMM, Ottime) and the Kinesis API
+    with simulated devices sharing the same THz pulse, stages and sample temperature """
+    LATENCY       = 8e-3    # s per GPIB transaction
+    BYTE_TIME     = 10e-6   # s per byte of binary buffer transfer
+    NOISE_DENSITY = 20e-12  # A/sqrt(Hz) at the lock-in input
+    TEMPERATURE   = 10.0    # K
+
+    LOCKIN_ADDRESS     = 'GPIB0::8::INSTR'
+    MULTIMETER_ADDRESS = 'GPIB0::22::INSTR'
+    OTTIME_ADDRESS     = 'ASRL1::INSTR'
+    KBD101_SERIAL      = '28250001'
+
+    def __init__(self, latency=LATENCY, stage_timing=True, noise=NOISE_DENSITY, temperature=TEMPERATURE):
+        self.latency     = latency
+        self.noise       = noise
+        self.temperature = temperature
+        self.pulse       = THzPulse()
+        self.thz_stage   = SimulatedStage(KBD101.MINIMUM_POSITION, KBD101.MAXIMUM_POSITION, timing=stage_timing)
+        self.pmp_stage   = SimulatedStage(0.0, 200.0, timing=stage_timing)
+
+    def install(self):
+        """ Makes every VISAInstrument and KBD101 connect to the simulated devices """
+        VISAInstrument.RESOURCE_MANAGER = SimulatedResourceManager(self)
+        KBD101.BACKEND                  = SimulatedKinesis(self)
+        print(f"Simulated instruments: lock-in {self.LOCKIN_ADDRESS}, multimeter {self.MULTIMETER_ADDRESS}, "
+              f"Ottime {self.OTTIME_ADDRESS}, KBD101 {self.KBD101_SERIAL}")
+
+    def signal(self, t):
+        """ Lock-in input current (A) at time t, for the stage positions at that time """
+        return self.pulse.field(self.thz_stage.positionAt(t), self.pmp_stage.positionAt(t))
+
+    def motion(self, since):
+        """ Returns the (start, end) times of the stage moves still going on after since, outside of
+        which the signal is constant; (inf, inf) if both stages stood still """
+        moves = [stage.motion for stage in (self.thz_stage, self.pmp_stage) if stage.motion[1] > since]
+        if not moves:
+            return np.inf, np.inf
+        return min(move[0] for move in moves), max(move[1] for move in moves)
+
+    def transaction(self, nbytes=0):
+        if self.latency:
+            tm.sleep(self.latency + nbytes * self.BYTE_TIME)
+
+
+class THzPulse:
+    """ Single-cycle THz pulse with a weaker substrate echo, reduced after the pump arrives """
+    C          = 0.299792458   # mm/ps
+    AMPLITUDE  = 20e-9         # A
+    ZERO       = 20.0          # mm, THz delay-line position of the pulse peak
+    WIDTH      = 0.25          # ps
+    ECHO       = (6.5, 0.15)   # ps delay and relative amplitude
+    PUMP_ZERO  = 100.0         # mm, pump delay-line position of the pump arrival
+    PUMP_DEPTH = 0.3           # relative transmission change
+    PUMP_DECAY = 5.0           # ps
+
+    def field(self, thz_pos, pmp_pos):
+        t = 2 * (thz_pos - self.ZERO) / self.C
+        E = self._cycle(t) + self.ECHO[1] * self._cycle(t - self.ECHO[0])
+        p = 2 * (pmp_pos - self.PUMP_ZERO) / self.C
+        return self.AMPLITUDE * E * (1 - self.PUMP_DEPTH * np.exp(-p / self.PUMP_DECAY) if p > 0 else 1)
+
+    def _cycle(self, t):
+        u = t / self.WIDTH
+        return -np.sqrt(2 * np.e) * u * np.exp(-u**2)
+
+
+class SimulatedStage:
+    """ Trapezoidal velocity profile: positionAt(t) follows the last move started before t """
+    VELOCITY     = 100.0   # mm/s
+    ACCELERATION = 999.0   # mm/s²
+
+    def __init__(self, minimum, maximum, timing=True):
+        self._minimum  = minimum
+        self._maximum  = maximum
+        self._timing   = timing
+        self._velocity = self.VELOCITY
+        self._acc      = self.ACCELERATION
+        self._start    = minimum
+        self._target   = minimum
+        self._t0       = 0.0
+        self._profile  = (0.0, 0.0, 0.0)   # acceleration time, cruise time, peak velocity
+
+    def setVelocity(self, velocity, acceleration=None):
+        self._velocity = float(velocity)
+        self._acc      = float(acceleration or self._acc)
+
+    def moveTo(self, position, t):
+        """ Starts a move at time t from wherever the stage is, and returns its duration """
+        self._start  = self.positionAt(t)
+        self._target = min(max(float(position), self._minimum), self._maximum)
+        self._t0     = t
+        d = abs(self._target - self._start)
+        if not self._timing or d == 0:
+            self._profile = (0.0, 0.0, 0.0)
+        elif d < self._velocity**2 / self._acc:
+            t_acc = np.sqrt(d / self._acc)
+            self._profile = (t_acc, 0.0, self._acc * t_acc)
+        else:
+            self._profile = (self._velocity / self._acc, (d - self._velocity**2 / self._acc) / self._velocity, self._velocity)
+        return self.duration
+
+    def stop(self, t):
+        self._start   = self._target = self.positionAt(t)
+        self._t0      = t
+        self._profile = (0.0, 0.0, 0.0)
+
+    @property
+    def duration(self): return 2 * self._profile[0] + self._profile[1]
+
+    def isMoving(self, t):
+        return t - self._t0 < self.duration
+
+    @property
+    def motion(self): return self._t0, self._t0 + self.duration
+
+    def positionAt(self, t):
+        t_acc, t_cruise, v = self._profile
+        dt = t - self._t0
+        if dt >= self.duration:
+            return self._target
+        if dt <= 0:
+            return self._start
+        if dt < t_acc:
+            d = v * dt**2 / (2 * t_acc)
+        elif dt < t_acc + t_cruise:
+            d = v * t_acc / 2 + v * (dt - t_acc)
+        else:
+            d = abs(self._target - self._start) - v * (self.duration - dt)**2 / (2 * t_acc)
+        return self._start + np.sign(self._target - self._start) * d
+
+
+class SimulatedResourceManager:
+    """ Stands for pyvisa's ResourceManager """
+    def __init__(self, simulator):
+        self._simulator = simulator
+
+    def list_resources(self):
+        return (Simulator.LOCKIN_ADDRESS, Simulator.MULTIMETER_ADDRESS, Simulator.OTTIME_ADDRESS)
+
+    def open_resource(self, address):
+        resources = {Simulator.LOCKIN_ADDRESS:     SimulatedSR830,
+                     Simulator.MULTIMETER_ADDRESS: SimulatedMultimeter,
+                     Simulator.OTTIME_ADDRESS:     SimulatedOttime}
+        return resources[address](self._simulator, address)
+
+
+class SimulatedResource:
+    """ Stands for a pyvisa resource: each write, read or query costs one GPIB transaction. A write
+    may hold several ';' separated commands, as in VISAInstrument batches """
+    IDN                = ""
+    RESPONSE_SEPARATOR = ';'     # joins the responses of a message, None returns one per read
+    SCPI               = False   # the headers after ';' continue the header path of the previous command
+
+    def __init__(self, simulator, address):
+        self._simulator = simulator
+        self._address   = address
+        self._responses = []
+        self.read_termination  = '\n'
+        self.write_termination = '\n'
+
+    def __str__(self):
+        return f"Simulated {self._address}"
+
+    def write(self, command):
+        self._simulator.transaction()
+        self._responses = []   # a new message discards the unread responses
+        path = ''
+        for part in command.strip().split(';'):
+            part = part.strip()
+            if self.SCPI:
+                part, path = self._resolve(part, path)
+            response = self.handle(part)
+            if response is not None:
+                self._responses.append(response)
+
+    @staticmethod
+    def _resolve(command, path):
+        """ Returns the full header of a SCPI command and the header path it leaves: a leading ':'
+        starts from the root, the common '*' commands leave the path unchanged """
+        if command.startswith('*'):
+            return command, path
+        header = command[1:] if command.startswith(':') else path + command
+        return header, header[:header.rfind(':') + 1]
+
+    def read(self):
+        self._simulator.transaction()
+        if self.RESPONSE_SEPARATOR is None:
+            response = self._responses.pop(0) if self._responses else ""
+        else:
+            response, self._responses = self.RESPONSE_SEPARATOR.join(r for r in self._responses if isinstance(r, str)), []
+        return response if isinstance(response, str) else ""
+
+    def read_bytes(self, count):
+        self._simulator.transaction(count)
+        response = self._responses.pop(0) if self._responses else b""
+        return response[:count]
+
+    def query(self, command):
+        self.write(command)
+        return self.read()
+
+    def close(self):
+        pass
+
+    def handle(self, command):
+        """ Returns the response of a query command, None otherwise """
+        if command == '*IDN?':
+            return self.IDN
+
+
+class SimulatedSR830(SimulatedResource):
+    """ Lock-in with an output filter of one to four RC stages (6 to 24 dB/oct, set by OFSL), white
+    input noise and the data buffer """
+    IDN                = "Stanford_Research_Systems,SR830,s/n00000,ver1.07"
+    RESPONSE_SEPARATOR = None
+    MAX_SUBSTEPS       = 40   # filter integration steps between two evaluations, beyond 10 time constants per stage the filter is settled
+
+    def __init__(self, simulator, address):
+        super().__init__(simulator, address)
+
+        self._sens    = '23'
+        self._oflt    = '4'
+        self._freq    = 1000.0
+        self._phase   = 0.0
+        self._ofsl    = '0'
+        self._rmod    = '1'
+        self._isrc    = '2'   # current input, 1 MOhm gain
+        self._t       = tm.perf_counter()
+        self._stages  = np.zeros(1)                 # filtered signal at the output of each RC stage
+        self._noise   = np.array([0.0, 0.0])        # X noise, Y noise
+        self._srat    = '13'
+        self._loop    = False
+        self._ddef    = {1: 0, 2: 0}
+        self._buffer  = []
+        self._running = False
+        self._next    = 0.0
+
+    @property
+    def tau(self): return LockIn.TCONS_LIST[self._oflt]
+    @property
+    def order(self): return LockIn.SLOPE_LIST[self._ofsl] // 6
+
+    def handle(self, command):
+        name, _, args = command.partition('?') if '?' in command else (command[:4], '', command[4:])
+        args = [a.strip() for a in args.split(',') if a.strip()]
+        if command.startswith('*IDN'):
+            return self.IDN
+        if '?' in command:
+            return self._query(name, args)
+        self._command(name, args)
+
+    def _query(self, name, args):
+        if name in ('OUTP', 'SNAP'):
+            X, Y = self._output(tm.perf_counter())
+            values = {1: X, 2: Y, 3: np.hypot(X, Y), 4: np.degrees(np.arctan2(Y, X)), 5: 0.0, 6: 0.0, 7: 0.0, 8: 0.0,
+                      9: float(self._freq), 10: X, 11: Y}   # unconnected aux inputs, displays showing X and Y
+            return ','.join(f'{values[int(a)]:.6e}' for a in args)
+        if name in ('TRCA', 'TRCB', 'TRCL'):
+            return self._trace(name, *map(int, args))
+        return {'SENS': self._sens, 'OFLT': self._oflt, 'FREQ': f'{self._freq}', 'PHAS': f'{self._phase}',
+                'OFSL': self._ofsl, 'RMOD': self._rmod, 'ISRC': self._isrc,
+                'SRAT': self._srat, 'SEND': str(int(self._loop)), 'SPTS': str(self._points())}.get(name, '0')
+
+    def _command(self, name, args):
+        if name in ('SENS', 'OFLT', 'SRAT', 'OFSL', 'RMOD', 'ISRC'):
+            if name == 'OFSL':
+                self._advance(tm.perf_counter())
+                self._stages = np.full(LockIn.SLOPE_LIST[args[0]] // 6, self._stages[-1])
+            setattr(self, f'_{name.lower()}', args[0])
+        elif name in ('FREQ', 'PHAS'):
+            setattr(self, '_freq' if name == 'FREQ' else '_phase', float(args[0]))
+        elif name == 'SEND':
+            self._loop = bool(int(args[0]))
+        elif name == 'DDEF':
+            self._ddef[int(args[0])] = int(args[1])
+        elif name == 'STRT' and not self._running:
+            self._advance(tm.perf_counter())
+            self._running = self._srat != '14'
+            self._next    = self._t
+        elif name == 'PAUS':
+            self._points()
+            self._running = False
+        elif name == 'REST':
+            self._buffer, self._running = [], False
+
+    def _points(self):
+        self._advance(tm.perf_counter())
+        return len(self._buffer)
+
+    def _trace(self, name, channel, start, count):
+        values = np.array([sample[channel - 1] for sample in self._buffer[start:start + count]])
+        if name == 'TRCA':
+            return ''.join(f'{value:.6e},' for value in values)
+        if name == 'TRCB':
+            return values.astype('<f4').tobytes()
+        exponent = np.where(values != 0, np.floor(np.log2(np.abs(values) + (values == 0))) - 14, 0) + 124
+        mantissa = np.round(values / 2.0 ** (exponent - 124))
+        return np.column_stack([mantissa, exponent]).astype('<i2').tobytes()
+
+    def _output(self, t):
+        self._advance(t)
+        return self._stages[-1] + self._noise[0], self._noise[1]
+
+    def _advance(self, t):
+        """ Integrates the filter up to t, recording the buffer samples due on the way """
+        while self._running and self._next <= t:
+            if len(self._buffer) == LockIn.BUFFER_SIZE and not self._loop:
+                self._running = False
+                break
+            self._integrate(self._next)
+            X, Y = self._stages[-1] + self._noise[0], self._noise[1]
+            self._buffer.append((np.hypot(X, Y) if self._ddef[1] == 1 else X,
+                                 np.degrees(np.arctan2(Y, X)) if self._ddef[2] == 1 else Y))
+            if len(self._buffer) > LockIn.BUFFER_SIZE:
+                del self._buffer[0]
+            self._next += 1 / LockIn.SRAT_LIST[self._srat]
+        self._integrate(t)
+
+    def _integrate(self, t):
+        """ Steps exactly over the intervals where the stages stand still, and in substeps while one moves """
+        start, end = self._simulator.motion(self._t)
+        if self._t < min(start, t):
+            self._step(min(start, t), self._simulator.signal(self._t))
+        if self._t < min(end, t):
+            self._substeps(min(end, t))
+        if self._t < t:
+            self._step(t, self._simulator.signal(t))
+
+    def _step(self, t, x):
+        # constant input: the RC cascade and the (first-order) noise process have exact solutions, the
+        # deviation of stage k from x collecting the deviations of the stages j <= k as e^-s s^(k-j)/(k-j)!
+        s     = (t - self._t) / self.tau
+        decay = np.exp(-s)
+        sigma = self._simulator.noise / np.sqrt(4 * self.tau)
+        deviation = self._stages - x
+        weights   = np.cumprod(np.r_[1.0, s / np.arange(1, len(deviation))])
+        self._stages = x + decay * np.array([weights[k::-1] @ deviation[:k + 1] for k in range(len(deviation))])
+        self._noise  = self._noise * decay + sigma * np.sqrt(1 - decay**2) * np.random.normal(size=2)
+        self._t = t
+
+    def _substeps(self, t):
+        settled = 10 * self.order * self.tau
+        if t - self._t > settled:
+            self._step(t - settled, self._simulator.signal(t - settled))
+        n  = min(int(np.ceil((t - self._t) / (self.tau / 4))), self.MAX_SUBSTEPS)
+        dt = (t - self._t) / n
+        for k in range(n):
+            self._step(self._t + dt, self._simulator.signal(self._t + dt))
+
+
+class SimulatedMultimeter(SimulatedResource):
+    """ Four-wire resistance of the Cernox at the simulator temperature. An unknown header, such as a
+    relative one batched after ';', is not answered and queues error -113 """
+    IDN      = "KEITHLEY INSTRUMENTS INC.,MODEL 2000,0000000,A19 /A02"
+    NOISE    = 1e-4   # relative resistance noise
+    SCPI     = True
+    COMMANDS = ('MEAS?', 'MEAS:VOLT?', 'MEAS:CURR?')
+
+    def __init__(self, simulator, address):
+        super().__init__(simulator, address)
+
+        from pandas import read_table
+        calibration = read_table(Cernox.CALIBRATION_FILE).sort_values('T')
+        self._T, self._R = calibration['T'].to_numpy(), calibration['R'].to_numpy()
+        self._errors = []
+
+    def handle(self, command):
+        if command == 'MEAS:FRES?' or command == 'MEAS:RES?':
+            R = np.interp(self._simulator.temperature, self._T, self._R)
+            return f'{R * (1 + np.random.normal(0, self.NOISE)):.6e}'
+        if command in self.COMMANDS:
+            return f'{np.random.normal(0, 1e-6):.6e}'
+        if command == 'SYST:ERR?':
+            return self._errors.pop(0) if self._errors else '0,"No error"'
+        if command == '*IDN?':
+            return super().handle(command)
+        self._errors.append('-113,"Undefined header"')
+
+
+class SimulatedOttime(SimulatedResource):
+    """ The Ottime controller answers a move only once it is done """
+    IDN = "Ottime Delay-line"
+
+    def handle(self, command):
+        stage = self._simulator.pmp_stage
+        if command.startswith('@0M'):
+            position, velocity = command[3:].split(',')
+            stage.setVelocity(velocity)
+            tm.sleep(stage.moveTo(position, tm.perf_counter()))
+            return '0'
+        if command.startswith('@0R'):
+            tm.sleep(stage.moveTo(0.0, tm.perf_counter()))
+            return '0'
+        return super().handle(command)
+
+
+class SimulatedKinesis:
+    """ Stands for both DeviceManagerCLI and KCubeBrushlessMotor """
+    def __init__(self, simulator):
+        self._simulator = simulator
+
+    def BuildDeviceList(self):
+        pass
+
+    def GetDeviceList(self):
+        return [Simulator.KBD101_SERIAL]
+
+    def CreateKCubeBrushlessMotor(self, serial):
+        return SimulatedKBD101Device(self._simulator, serial)
+
+
+class SimulatedKBD101Device:
+    """ Duck-types the Kinesis KCubeBrushlessMotor calls used by KBD101 """
+    STOP_POLLING = 0.05   # s, how often a blocking move checks whether it was stopped
+
+    class DeviceInfo:
+        def __init__(self, serial):
+            self.Name         = "Simulated KBD101"
+            self.SerialNumber = serial
+
+    class MotionStatus:
+        def __init__(self, stage):
+            self._stage = stage
+
+        @property
+        def IsInMotion(self): return self._stage.isMoving(tm.perf_counter())
+
+    def __init__(self, simulator, serial):
+        self._simulator = simulator
+        self._serial    = serial
+        self._stage     = simulator.thz_stage
+        self.Status     = self.MotionStatus(self._stage)
+
+    @property
+    def Position(self): return self._stage.positionAt(tm.perf_counter())
+
+    def Connect(self, serial):
+        self._simulator.transaction()
+
+    def Disconnect(self):
+        self._simulator.transaction()
+
+    def LoadMotorConfiguration(self, serial):
+        pass
+
+    def GetDeviceInfo(self):
+        return self.DeviceInfo(self._serial)
+
+    def StartPolling(self, rate):
+        pass
+
+    def StopPolling(self):
+        pass
+
+    def RequestPosition(self):
+        self._simulator.transaction()
+
+    def SetVelocityParams(self, velocity, acceleration):
+        self._stage.setVelocity(float(str(velocity).replace(',', '.')), float(str(acceleration).replace(',', '.')))
+
+    def MoveTo(self, position, timeout):
+        """ Blocks until the move is done or stopped, unless timeout is 0 """
+        self._simulator.transaction()
+        t   = tm.perf_counter()
+        end = t + self._stage.moveTo(float(str(position).replace(',', '.')), t)
+        while timeout and t < end and self._stage.isMoving(t):
+            tm.sleep(min(end - t, self.STOP_POLLING))
+            t = tm.perf_counter()
+
+    def Stop(self, timeout):
+        self._simulator.transaction()
+        self._stage.stop(tm.perf_counter())
\ No newline at end of file
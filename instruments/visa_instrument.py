@@ -1,6 +1,7 @@
 import os
-from pyvisa import ResourceManager
+import threading
 from PyQt6.QtCore import QObject, pyqtSignal
+from .io_worker import IOWorker, serialized
 
 
 class VISAInstrumentSignals(QObject):
@@ -9,15 +10,23 @@ class VISAInstrumentSignals(QObject):
 
 
 class VISAInstrument:
-    PRESET_FOLDER     = './preset'
-    READ_TERMINATION  = '\n'
-    WRITE_TERMINATION = '\n'
+    PRESET_FOLDER      = './preset'
+    READ_TERMINATION   = '\n'
+    WRITE_TERMINATION  = '\n'
+    COMMAND_SEPARATOR  = ';'    # joins the commands of a batch into one write, None sends them one by one
+    RESPONSE_SEPARATOR = ';'    # splits the responses to a batch, None reads each response separately
+    MAX_MESSAGE_LENGTH = 256    # characters per batched write, the size of the smallest input buffers
+    RESOURCE_MANAGER   = None   # shared by all the instruments, created on first use or set to the simulator's
+    
+    _lock      = threading.RLock()
+    _addresses = None          # (resource manager, addresses) of the last enumeration
 
     def __init__(self, name="VISA Instrument"):
         self._name    = name
         self._address = None
         self._device  = None
         self._signals = VISAInstrumentSignals()
+        self._io      = IOWorker(name)
         
     @property
     def name(self): return self._name
@@ -28,13 +37,65 @@ class VISAInstrument:
     @property
     def signals(self): return self._signals
     @property
+    def io(self): return self._io
+    @property
     def idn(self): return ""
     
+    @classmethod
+    def resourceManager(cls):
+        with cls._lock:
+            if VISAInstrument.RESOURCE_MANAGER is None:
+                from pyvisa import ResourceManager   # deferred: pyvisa is slow to import
+                VISAInstrument.RESOURCE_MANAGER = ResourceManager()
+            return VISAInstrument.RESOURCE_MANAGER
+    
+    def batch(self):
+        """ Returns a Batch of commands to send in as few round trips as the instrument allows """
+        return Batch(self)
+    
+    @serialized
+    def sendBatch(self, commands):
+        """ Sends the (command, parse) pairs, parse being None for the commands without response, and
+        returns the parsed responses in the order of the queries """
+        results = []
+        for group in self._messages(commands):
+            parsers = [parse for _, parse in group if parse is not None]
+            self.device.write(self._join([command for command, _ in group]))
+            if not parsers:
+                continue
+            if self.RESPONSE_SEPARATOR is None:
+                responses = [self.device.read() for _ in parsers]
+            else:
+                responses = self.device.read().split(self.RESPONSE_SEPARATOR)
+            if len(responses) != len(parsers):
+                raise ValueError(f"{self.name} answered {len(responses)} responses to {len(parsers)} queries")
+            results += [parse(response.strip()) for parse, response in zip(parsers, responses)]
+        return results
+    
+    def _join(self, commands):
+        """ Returns the message sending the commands at once """
+        return (self.COMMAND_SEPARATOR or '').join(commands)
+    
+    def _messages(self, commands):
+        """ Groups the commands into messages of at most MAX_MESSAGE_LENGTH characters """
+        if self.COMMAND_SEPARATOR is None:
+            return [[pair] for pair in commands]
+        groups, length = [], 0
+        for pair in commands:
+            added = len(self._join(['', pair[0]]))
+            if groups and length + added <= self.MAX_MESSAGE_LENGTH:
+                groups[-1].append(pair)
+                length += added
+            else:
+                groups.append([pair])
+                length = len(self._join([pair[0]]))
+        return groups
+    
+    @serialized
     def connect(self):
-        rm = ResourceManager()
         if self.address:
             try:
-                self._device = rm.open_resource(self.address)
+                self._device = self.resourceManager().open_resource(self.address)
                 self.device.read_termination  = self.READ_TERMINATION
                 self.device.write_termination = self.WRITE_TERMINATION
                 print(f"Connected the {self.name}: {self.idn} ({self.device})")
@@ -42,8 +103,9 @@ class VISAInstrument:
             except:
                 print(f"Failed to connect the {self.name} ({self.address})")
         else:
-            print(f"Failed to connect the {self.name}. You must specify an address within:\n{rm.list_resources()}")
+            print(f"Failed to connect the {self.name}. You must specify an address within:\n{self.addressList()}")
             
+    @serialized
     def disconnect(self):
         try:
             self.device.close()
@@ -56,9 +118,15 @@ class VISAInstrument:
     def setAddress(self, address):
         self._address = address
         
-    def addressList(self):
-        rm = ResourceManager()
-        return rm.list_resources()
+    @classmethod
+    def addressList(cls, refresh=False):
+        """ Enumerates the bus once for all the instruments (possibly from a background thread); the
+        cached list is returned until refresh is asked for or the resource manager is replaced """
+        with cls._lock:
+            rm = cls.resourceManager()
+            if refresh or VISAInstrument._addresses is None or VISAInstrument._addresses[0] is not rm:
+                VISAInstrument._addresses = rm, rm.list_resources()
+            return VISAInstrument._addresses[1]
                 
     def loadPresetAddress(self):
         preset_address = ""
@@ -81,6 +149,27 @@ class VISAInstrument:
             print(f"Failed to save {self.name} current address to preset folder")
 
 
+class Batch:
+    """ Queues the commands of an instrument, sent together by send, which returns the responses to the
+    queries parsed by their parse function:
+        sens, freq = lockin.batch().write('OFLT4').query('SENS?').query('FREQ?', float).send() """
+    def __init__(self, instrument):
+        self._instrument = instrument
+        self._commands   = []
+        
+    def write(self, command):
+        self._commands.append((command, None))
+        return self
+        
+    def query(self, command, parse=str):
+        self._commands.append((command, parse))
+        return self
+        
+    def send(self):
+        commands, self._commands = self._commands, []
+        return self._instrument.sendBatch(commands) if commands else []
+
+
 class VISAInstrument_foo:
     PRESET_FOLDER     = './preset'
     READ_TERMINATION  = '\n'
@@ -91,6 +180,7 @@ class VISAInstrument_foo:
         self._address = None
         self._device  = None
         self._signals = VISAInstrumentSignals()
+        self._io      = IOWorker(name)
         
     @property
     def name(self): return self._name
@@ -101,13 +191,17 @@ class VISAInstrument_foo:
     @property
     def signals(self): return self._signals
     @property
+    def io(self): return self._io
+    @property
     def idn(self): return ""
     
+    @serialized
     def connect(self):
         self._device = None
         print('"Connected" empty instrument ({self.name})')
         self.signals.connected.emit()
             
+    @serialized
     def disconnect(self):
         print(f'"Disconnected" empty instrument ({self.name})')
         self._device = None
@@ -116,9 +210,8 @@ class VISAInstrument_foo:
     def setAddress(self, address):
         self._address = address
         
-    def addressList(self):
-        rm = ResourceManager()
-        return rm.list_resources()
+    def addressList(self, refresh=False):
+        return VISAInstrument.addressList(refresh)
                 
     def loadPresetAddress(self):
         preset_address = ""
@@ -1,4 +1,6 @@
 from .main_window import MainWindow
 from .liveplot import LivePlot
 from .instrument_widget import InstrumentWidget
-from .parameters_widget import ParametersWidget
\ No newline at end of file
+from .parameters_widget import ParametersWidget
+from .archive_widget import ArchiveWidget
+from .timing_widget import TimingWidget
\ No newline at end of file
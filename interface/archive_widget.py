@@ -0,0 +1,78 @@
+from PyQt6.QtWidgets import QWidget, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QHBoxLayout, QVBoxLayout
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+
+
+class ArchiveWidget(QWidget):
+    BUTTON_WIDTH = 80
+    COLUMNS      = ('timestamp', 'user', 'sample', 'temp', 'thz_start', 'thz_end', 'pmp_start', 'pmp_end', 'obs', 'path')
+
+    def __init__(self, catalog):
+        super().__init__()
+
+        self.catalog        = catalog
+        self.entry          = QLineEdit()
+        self.search_button  = QPushButton("Search")
+        self.rebuild_button = QPushButton("Rebuild")
+        self.table          = QTableWidget(0, len(self.COLUMNS))
+        self.worker         = None
+
+        self.entry.setPlaceholderText("user=Nick sample=GaAs* temp=4..12")
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        for button in (self.search_button, self.rebuild_button):
+            button.setFixedWidth(self.BUTTON_WIDTH)
+
+        self.search_button.clicked.connect(self._search)
+        self.entry.returnPressed.connect(self._search)
+        self.rebuild_button.clicked.connect(self._rebuild)
+
+        search_layout = QHBoxLayout()
+        for item in (self.entry, self.search_button, self.rebuild_button):
+            search_layout.addWidget(item)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(search_layout)
+        layout.addWidget(self.table)
+
+    @pyqtSlot()
+    def _search(self):
+        try:
+            results = self.catalog.query(**self.catalog.parseFilters(self.entry.text()))
+        except:
+            print(f"Invalid catalog query: {self.entry.text()}")
+            return
+
+        self.table.setRowCount(len(results))
+        for row, scan in enumerate(results.itertuples(index=False)):
+            scan = scan._asdict()
+            for column, field in enumerate(self.COLUMNS):
+                self.table.setItem(row, column, QTableWidgetItem(str(scan[field])))
+        print(f"Found {len(results)} scans")
+    @pyqtSlot()
+    def _rebuild(self):
+        # indexing the archive reads every new file: it runs in the background
+        self.rebuild_button.setEnabled(False)
+        self.worker = RebuildWorker(self.catalog)
+        self.worker.signals.done.connect(self._rebuilt)
+        QThreadPool.globalInstance().start(self.worker)
+    @pyqtSlot()
+    def _rebuilt(self):
+        self.rebuild_button.setEnabled(True)
+        self._search()
+
+
+class RebuildSignals(QObject):
+    done = pyqtSignal()
+
+
+class RebuildWorker(QRunnable):
+    def __init__(self, catalog):
+        super().__init__()
+        self.catalog = catalog
+        self.signals = RebuildSignals()
+
+    def run(self):
+        try:
+            self.catalog.rebuild()
+        except:
+            print("Could not rebuild the catalog")
+        self.signals.done.emit()
\ No newline at end of file
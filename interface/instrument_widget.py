@@ -1,6 +1,8 @@
+import threading
 from PyQt6.QtWidgets import QWidget, QTabWidget, QLabel, QLineEdit, QComboBox, QPushButton, QHBoxLayout, QVBoxLayout
 from PyQt6.QtGui import QDoubleValidator
-from PyQt6.QtCore import Qt, QLocale, pyqtSlot
+from PyQt6.QtCore import Qt, QLocale, QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+from instruments.io_worker import FutureSignals
 
 
 class InstrumentWidget(QTabWidget):
@@ -56,53 +58,102 @@ class InstrumentConnectionWidget(QWidget):
         self.label      = QLabel(f"{self.instrument.name}:")
         self.combo      = QComboBox()
         self.button     = QPushButton("Connect")
+        self.refresh    = QPushButton("Refresh")
+        self.worker     = None
+        self.pending    = None
         
         self.label.setFixedWidth(self.LABEL_WIDTH)
         self.combo.setFixedWidth(self.COMBO_WIDTH)
         self.button.setFixedWidth(self.BUTTON_WIDTH)
+        self.refresh.setFixedWidth(self.BUTTON_WIDTH)
         
         self._initCombo()
         self._configSlots()
         
         layout = QHBoxLayout(self)
-        for item in (self.label, self.combo, self.button):
+        for item in (self.label, self.combo, self.button, self.refresh):
             layout.addWidget(item)
         
         layout.setContentsMargins(*self.CONTENTS_MARGINS)
         layout.setAlignment(Qt.AlignmentFlag.AlignLeft)
         
     def _initCombo(self):
-        self.combo.addItems(self.instrument.addressList())
+        # the preset address is usable right away, the bus is enumerated in the background
         self.combo.setEditable(True)
         self.combo.setCurrentText(self.instrument.loadPresetAddress())
         self.instrument.setAddress(self.combo.currentText())
+        self._discover(refresh=False)
+        
+    def _discover(self, refresh):
+        self.refresh.setEnabled(False)
+        self.worker = DiscoveryWorker(self.instrument, refresh)
+        self.worker.signals.found.connect(lambda addresses: self._fillCombo(addresses))
+        QThreadPool.globalInstance().start(self.worker)
         
     def _configSlots(self):
         self.instrument.signals.connected.connect(self._instrumentConnected)
         self.instrument.signals.disconnected.connect(self._instrumentDisconnected)
         self.combo.currentTextChanged.connect(lambda address: self._setInstrumentAddress(address))
         self.button.clicked.connect(self._buttonClicked)
+        self.refresh.clicked.connect(lambda: self._discover(refresh=True))
         
     @pyqtSlot()
+    def _fillCombo(self, addresses):
+        current = self.combo.currentText()
+        self.combo.blockSignals(True)
+        self.combo.clear()
+        self.combo.addItems(addresses)
+        self.combo.setCurrentText(current)
+        self.combo.blockSignals(False)
+        self.refresh.setEnabled(self.combo.isEnabled())
+    @pyqtSlot()
     def _instrumentConnected(self):
         self.combo.setEnabled(False)
+        self.refresh.setEnabled(False)
         self.button.setText("Disconnect")
         self.instrument.savePresetAddress()
     @pyqtSlot()
     def _instrumentDisconnected(self):
         self.combo.setEnabled(True)
+        self.refresh.setEnabled(True)
         self.button.setText("Connect")
     @pyqtSlot()
     def _setInstrumentAddress(self, address):
         self.instrument.setAddress(address)
     @pyqtSlot()
     def _buttonClicked(self):
+        # (dis)connecting can take seconds (enumeration, motor configuration): it runs on the instrument thread
         if self.button.text() == "Connect":
-            self.instrument.connect()
+            operation = self.instrument.connect
         elif self.button.text() == "Disconnect":
-            self.instrument.disconnect()
+            operation = self.instrument.disconnect
+        self.button.setEnabled(False)
+        self.pending = FutureSignals(self.instrument.io.submit(operation), self._operationEnded, self._operationEnded)
+    @pyqtSlot(object)
+    def _operationEnded(self, result):
+        self.button.setEnabled(True)
             
             
+class DiscoverySignals(QObject):
+    found = pyqtSignal(object)   # list of address strings
+    
+    
+class DiscoveryWorker(QRunnable):
+    def __init__(self, instrument, refresh):
+        super().__init__()
+        self.instrument = instrument
+        self.refresh    = refresh
+        self.signals    = DiscoverySignals()
+        
+    def run(self):
+        try:
+            addresses = [str(address) for address in self.instrument.addressList(refresh=self.refresh)]
+        except:
+            print(f"Could not list the {self.instrument.name} addresses")
+            addresses = []
+        self.signals.found.emit(addresses)
+        
+        
 class GeneralControllerWidget(QWidget):
     LABEL_WIDTH  = 100
     ENTRY_WIDTH  = 150
@@ -116,6 +167,10 @@ class GeneralControllerWidget(QWidget):
         self.instrument = instrument
         self.label      = QLabel(f"{self.instrument.name}:")
         self.entry      = QLineEdit()
+        self.actions    = []     # buttons disabled while an operation runs on the instrument thread
+        self.pending    = None   # FutureSignals of the running operation
+        self._done      = None
+        self._failure   = ""
         
         self.label.setFixedWidth(self.LABEL_WIDTH)
         self.entry.setFixedWidth(self.ENTRY_WIDTH)
@@ -136,12 +191,31 @@ class GeneralControllerWidget(QWidget):
         self.instrument.signals.connected.connect(self._instrumentConnected)
         self.instrument.signals.disconnected.connect(self._instrumentDisconnected)
     
+    def _submit(self, operation, *args, done=None, failure=""):
+        """ Runs a hardware operation on the instrument thread, so that the window stays responsive;
+        done receives its result and failure is printed if it raises """
+        for item in self.actions:
+            item.setEnabled(False)
+        self._done, self._failure = done, failure
+        self.pending = FutureSignals(self.instrument.io.submit(operation, *args), self._operationFinished, self._operationFailed)
+    
     @pyqtSlot()
     def _instrumentConnected(self):
         self.setEnabled(True)
     @pyqtSlot()
     def _instrumentDisconnected(self):
         self.setEnabled(False)
+    @pyqtSlot(object)
+    def _operationFinished(self, result):
+        for item in self.actions:
+            item.setEnabled(True)
+        if self._done is not None:
+            self._done(result)
+    @pyqtSlot(object)
+    def _operationFailed(self, error):
+        for item in self.actions:
+            item.setEnabled(True)
+        print(self._failure or f"The {self.instrument.name} operation failed ({error})")
         
         
 class DelaylineValidator(QDoubleValidator):
@@ -159,13 +233,15 @@ class KBD101ControllerWidget(GeneralControllerWidget):
     def __init__(self, instrument):
         super().__init__(instrument)
         
-        self.get_button = QPushButton("Get")
-        self.set_button = QPushButton("Set")
+        self.get_button  = QPushButton("Get")
+        self.set_button  = QPushButton("Set")
+        self.stop_button = QPushButton("Stop")
+        self.actions     = [self.get_button, self.set_button]
         
         self._configEntry()
         self._configSlots()
         
-        for item in (self.get_button, self.set_button):
+        for item in (self.get_button, self.set_button, self.stop_button):
             item.setFixedWidth(self.BUTTON_WIDTH)
             self.layout().addWidget(item)
             
@@ -176,25 +252,35 @@ class KBD101ControllerWidget(GeneralControllerWidget):
     def _configSlots(self):
         self.get_button.clicked.connect(self._getPosition)
         self.set_button.clicked.connect(self._setPosition)
+        self.stop_button.clicked.connect(self._stop)
         self.entry.returnPressed.connect(self._setPosition)
         
     @pyqtSlot()
     def _getPosition(self):
-        try:
-            self.entry.setText(str(self.instrument.currentPosition()))
-        except:
-            print(f"Could not retrieve the {self.instrument.name} current position")
+        self._submit(self.instrument.currentPosition, done=lambda position: self.entry.setText(str(position)),
+                     failure=f"Could not retrieve the {self.instrument.name} current position")
     @pyqtSlot()
     def _setPosition(self):
+        if not self.get_button.isEnabled():
+            return
         if self.entry.hasAcceptableInput():
             position = float(self.entry.text())
-            try:
-                self.instrument.returnTo(position)
-                print(f"{self.instrument.name} returned to {position}mm")
-            except:
-                print(f"Could not return the {self.instrument.name} to {position}mm")
+            self._submit(self.instrument.returnTo, position, done=lambda _: print(f"{self.instrument.name} returned to {position}mm"),
+                         failure=f"Could not return the {self.instrument.name} to {position}mm")
         else:
             print(f"Out of {self.instrument.name} range({self.instrument.MINIMUM_POSITION} to {self.instrument.MAXIMUM_POSITION}mm)")
+    @pyqtSlot()
+    def _stop(self):
+        # bypasses the instrument thread, where the move being stopped is running, and waits for the
+        # deceleration on a thread of its own so that the window stays responsive
+        threading.Thread(target=self._halt, name="Stop", daemon=True).start()
+        
+    def _halt(self):
+        try:
+            self.instrument.stop()
+            print(f"Stopped the {self.instrument.name}")
+        except:
+            print(f"Could not stop the {self.instrument.name}")
             
             
 class OttimeControllerWidget(GeneralControllerWidget):
@@ -203,6 +289,7 @@ class OttimeControllerWidget(GeneralControllerWidget):
         
         self.home_button = QPushButton("Home")
         self.set_button  = QPushButton("Set")
+        self.actions     = [self.home_button, self.set_button]
         
         self._configEntry()
         self._configSlots()
@@ -222,20 +309,16 @@ class OttimeControllerWidget(GeneralControllerWidget):
         
     @pyqtSlot()
     def _findHome(self):
-        try:
-            self.instrument.home()
-            print(f"{self.instrument.name} found the home")
-        except:
-            print(f"Could not home the {self.instrument.name}")
+        self._submit(self.instrument.home, done=lambda _: print(f"{self.instrument.name} found the home"),
+                     failure=f"Could not home the {self.instrument.name}")
     @pyqtSlot()
     def _setPosition(self):
+        if not self.set_button.isEnabled():
+            return
         if self.entry.hasAcceptableInput():
             position = float(self.entry.text())
-            try:
-                self.instrument.returnTo(position)
-                print(f"{self.instrument.name} returned to {position}mm")
-            except:
-                print(f"Could not return the {self.instrument.name} to {position}mm")
+            self._submit(self.instrument.returnTo, position, done=lambda _: print(f"{self.instrument.name} returned to {position}mm"),
+                         failure=f"Could not return the {self.instrument.name} to {position}mm")
         else:
             print(f"Out of {self.instrument.name} range({self.instrument.MINIMUM_POSITION} to {self.instrument.MAXIMUM_POSITION}mm)")
             
@@ -244,7 +327,8 @@ class CernoxControllerWidget(GeneralControllerWidget):
     def __init__(self, instrument):
         super().__init__(instrument)
         
-        self.button = QPushButton("Get")
+        self.button  = QPushButton("Get")
+        self.actions = [self.button]
         self.button.setFixedWidth(self.BUTTON_WIDTH)
         self.button.clicked.connect(self._getTemperature)
         
@@ -252,21 +336,20 @@ class CernoxControllerWidget(GeneralControllerWidget):
         
     @pyqtSlot()
     def _getTemperature(self):
-        try:
-            self.entry.setText(str(self.instrument.temperature()))
-        except:
-            print(f"Could not retrieve the {self.instrument.name} current temperature")
+        self._submit(self.instrument.temperature, done=lambda temperature: self.entry.setText(str(temperature)),
+                     failure=f"Could not retrieve the {self.instrument.name} current temperature")
 
 
 class LockinControllerWidget(GeneralControllerWidget):
     def __init__(self, instrument):
         super().__init__(instrument)
         
-        self.combo  = QComboBox()
-        self.button = QPushButton("Get")
+        self.combo   = QComboBox()
+        self.button  = QPushButton("Get")
+        self.actions = [self.button]
         
         self.combo.setFixedWidth(self.COMBO_WIDTH)
-        self.combo.addItems(("X", "Y", "phase", "freq", "sens", "tcons"))
+        self.combo.addItems(("X", "Y", "phase", "freq", "sens", "tcons", "slope", "reserve"))
         
         self.button.setFixedWidth(self.BUTTON_WIDTH)        
         self.button.clicked.connect(self._getValue)
@@ -289,9 +372,11 @@ class LockinControllerWidget(GeneralControllerWidget):
             fn = self.instrument.sens
         elif prop == "tcons":
             fn = self.instrument.tcons
+        elif prop == "slope":
+            fn = self.instrument.slope
+        elif prop == "reserve":
+            fn = self.instrument.reserve
                 
-        try:
-            self.entry.setText(str(fn()))
-        except:
-            print(f"Could not retrieve the {self.instrument.name} {prop}")
+        self._submit(fn, done=lambda value: self.entry.setText(str(value)),
+                     failure=f"Could not retrieve the {self.instrument.name} {prop}")
             
\ No newline at end of file
@@ -1,13 +1,178 @@
-from pyqtgraph import PlotWidget, plot
-from PyQt6.QtCore import pyqtSlot
+import numpy as np
+from pyqtgraph import PlotWidget, FillBetweenItem, ImageItem, mkBrush
+from PyQt6.QtWidgets import QWidget, QSplitter, QLabel, QComboBox, QHBoxLayout, QVBoxLayout
+from PyQt6.QtCore import Qt, QRectF, QTimer, pyqtSlot
+from experiment.spectrum import IncrementalSpectrum
 
 
-class LivePlot(PlotWidget):
+class LivePlot(QSplitter):
+    MAX_FPS = 30   # redraws per second, whatever the rate of the updates
+
+    def __init__(self):
+        super().__init__(Qt.Orientation.Vertical)
+
+        self.waveform   = PlotWidget()
+        self.spectrum   = SpectrumPlot()
+        self.data_line  = self.waveform.plot(connect='finite')
+        self.image      = ImageItem()
+        self.band_lower = self.waveform.plot(connect='finite', pen=None)
+        self.band_upper = self.waveform.plot(connect='finite', pen=None)
+        self.band       = FillBetweenItem(self.band_lower, self.band_upper, brush=mkBrush(100, 100, 255, 80))
+        self.timer      = QTimer(self)
+
+        for item in (self.image, self.band):
+            self.waveform.addItem(item)
+
+        # min/max decimation down to about one point per pixel, recomputed on zoom; clip-to-view
+        # presumes increasing x, so the scans going backwards are drawn reversed
+        self.waveform.setDownsampling(auto=True, mode='peak')
+        self.waveform.setClipToView(True)
+
+        self.addWidget(self.waveform)
+        self.addWidget(self.spectrum)
+        self.setStretchFactor(0, 2)
+        self.setStretchFactor(1, 1)
+
+        self._dirty = None
+        self.reset(np.zeros(0))
+        self.resetImage(np.zeros(2), np.zeros(2))
+
+        self.timer.timeout.connect(self._redraw)
+        self.timer.start(1000 // self.MAX_FPS)
+
+    @pyqtSlot()
+    def reset(self, pos):
+        """ Allocates the buffers of a new scan over the positions pos; the updates are then written in place """
+        n           = len(pos)
+        self._x     = np.full(n, np.nan)
+        self._y     = np.full(n, np.nan)
+        self._err   = np.full(n, np.nan)
+        self._count = 0
+        self._dirty = None
+        self._order = slice(None, None, -1) if n > 1 and pos[0] > pos[-1] else slice(None)
+
+        self.image.clear()
+        self.data_line.clear()
+        self._clearBand()
+        self.spectrum.reset(pos)
+
+    @pyqtSlot()
+    def update(self, start, x, y):
+        stop = start + len(x)
+        self._x[start:stop] = x
+        self._y[start:stop] = y
+        self._count = max(self._count, stop)
+        self._dirty = self._dirty or 'line'
+        self.spectrum.update(start, x, y)
+
+    @pyqtSlot()
+    def updateBand(self, start, x, y, err):
+        """ Plots y with a y ± err band; points without an error estimate get a zero-width band """
+        self._err[start:start + len(x)] = np.nan_to_num(err)
+        self.update(start, x, y)
+        self._dirty = 'band'
+
+    def _clearBand(self):
+        self.band_lower.setData([], [])
+        self.band_upper.setData([], [])
+
+    @pyqtSlot()
+    def resetImage(self, x, y):
+        """ Prepares an image of len(y) rows by len(x) columns; x and y must be evenly spaced """
+        self._flip_x = x[0] > x[-1]
+        self._flip_y = y[0] > y[-1]
+        self._z      = np.full((len(y), len(x)), np.nan)
+        self._dirty  = None
+
+        x, y = np.sort(x), np.sort(y)
+        dx   = (x[-1] - x[0]) / max(len(x) - 1, 1)
+        dy   = (y[-1] - y[0]) / max(len(y) - 1, 1)
+        self._rect = QRectF(x[0] - dx/2, y[0] - dy/2, x[-1] - x[0] + dx, y[-1] - y[0] + dy)
+
+        self.image.clear()
+        self.data_line.clear()
+        self._clearBand()
+        self.spectrum.reset(np.zeros(0))
+
+    @pyqtSlot()
+    def updateImage(self, j, row):
+        self._z[len(self._z) - 1 - j if self._flip_y else j] = row[::-1] if self._flip_x else row
+        self._dirty = 'image'
+
+    @pyqtSlot()
+    def _redraw(self):
+        """ Draws the updates received since the last frame at once; the slots above only fill the buffers """
+        dirty, self._dirty = self._dirty, None
+        self.spectrum.redraw()
+        if dirty == 'image' and not np.all(np.isnan(self._z)):
+            self.image.setImage(self._z.T, levels=(np.nanmin(self._z), np.nanmax(self._z)))
+            self.image.setRect(self._rect)
+        elif dirty in ('line', 'band'):
+            x, y = self._x[:self._count][self._order], self._y[:self._count][self._order]
+            self.data_line.setData(x=x, y=y)
+            if dirty == 'band':
+                err = self._err[:self._count][self._order]
+                self.band_lower.setData(x=x, y=y - err)
+                self.band_upper.setData(x=x, y=y + err)
+
+
+class SpectrumPlot(QWidget):
+    COMBO_WIDTH = 80
+
     def __init__(self):
         super().__init__()
-        
-        self.data_line = self.plot()
+
+        self.spectrum       = IncrementalSpectrum()
+        self.plot_widget    = PlotWidget()
+        self.amplitude_line = self.plot_widget.plot()
+        self.window_combo   = QComboBox()
+        self.padding_combo  = QComboBox()
+        self._dirty         = False
+
+        self.plot_widget.setLogMode(y=True)
+        self.plot_widget.setLabel('bottom', "Frequency", "THz")
+        self.plot_widget.setLabel('left', "Amplitude")
+
+        self.window_combo.addItems(IncrementalSpectrum.WINDOWS)
+        self.window_combo.setCurrentText(self.spectrum.window)
+        self.padding_combo.addItems([f"x{padding}" for padding in IncrementalSpectrum.PADDINGS])
+        self.padding_combo.setCurrentText(f"x{self.spectrum.padding}")
+        for combo in (self.window_combo, self.padding_combo):
+            combo.setFixedWidth(self.COMBO_WIDTH)
+            combo.currentTextChanged.connect(lambda text: self._setOptions())
+
+        options_layout = QHBoxLayout()
+        options_layout.addWidget(QLabel("Window"))
+        options_layout.addWidget(self.window_combo)
+        options_layout.addWidget(QLabel("Zero-padding"))
+        options_layout.addWidget(self.padding_combo)
+        options_layout.addStretch()
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(options_layout)
+        layout.addWidget(self.plot_widget)
+
+    @pyqtSlot()
+    def reset(self, pos):
+        self.spectrum.reset(pos)
+        self.amplitude_line.clear()
+        self._dirty = False
+
+    @pyqtSlot()
+    def update(self, start, x, y):
+        """ Stores the new points; the spectrum is computed and redrawn at the LivePlot frame rate """
+        self.spectrum.update(start, x, y)
+        self._dirty = True
+
+    @pyqtSlot()
+    def redraw(self):
+        if self._dirty:
+            self.spectrum.compute()
+            self.amplitude_line.setData(x=self.spectrum.frequencies, y=self.spectrum.amplitude)
+            self._dirty = False
 
     @pyqtSlot()
-    def update(self, x, y):
-        self.data_line.setData(x=x, y=y)
\ No newline at end of file
+    def _setOptions(self):
+        self.spectrum.setOptions(self.window_combo.currentText(), int(self.padding_combo.currentText()[1:]))
+        self._dirty = True
\ No newline at end of file
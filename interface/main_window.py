@@ -21,6 +21,12 @@ class MainWindow(QMainWindow):
         
     def setParametersWidget(self, widget):
         parameters_widget = DockWidget(self, "Measurement Parameters", widget)
+        
+    def setArchiveWidget(self, widget):
+        archive_widget = DockWidget(self, "Archive", widget)
+        
+    def setTimingWidget(self, widget):
+        timing_widget = DockWidget(self, "Acquisition Timing", widget)
     
     def setLivePlot(self, live_plot):
         self.setCentralWidget(live_plot)
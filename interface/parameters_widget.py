@@ -1,16 +1,20 @@
-from PyQt6.QtWidgets import QWidget, QTabWidget, QLabel, QLineEdit, QTextEdit, QCheckBox, QPushButton, QGroupBox
+from PyQt6.QtWidgets import QWidget, QTabWidget, QLabel, QLineEdit, QTextEdit, QCheckBox, QComboBox, QPushButton, QGroupBox
 from PyQt6.QtWidgets import QHBoxLayout, QVBoxLayout, QGridLayout, QSizePolicy
 from PyQt6.QtGui import QDoubleValidator, QIntValidator, QFont
 from PyQt6.QtCore import Qt, QLocale, pyqtSlot
+from instruments.io_worker import FutureSignals
+from experiment.measurement import Measurement
 
 
 class ParametersWidget(QTabWidget):
     def __init__(self, parameters):
         super().__init__()
         
+        self.parameters   = parameters
         self.info_page    = ParametersInfoPage(parameters)
         self.scan_page    = ParametersScanPage(parameters)
         self.control_page = MeasurementControlPage(parameters)
+        self.pending      = None
         
         self.addTab(self.info_page, "Info")
         self.addTab(self.scan_page, "Scan")
@@ -26,6 +30,8 @@ class ParametersWidget(QTabWidget):
     @property
     def stop_button(self): return self.control_page.control_widget.stop_button
     @property
+    def resume_button(self): return self.control_page.control_widget.resume_button
+    @property
     def text(self): return self.control_page.text
     
     @pyqtSlot()
@@ -33,19 +39,33 @@ class ParametersWidget(QTabWidget):
         self.info_page.setEnabled(state)
         self.scan_page.setEnabled(state)
     @pyqtSlot()
+    def refreshPages(self):
+        for widget in self.findChildren((EntryWidget, ComboWidget, CheckBoxWidget)):
+            widget.refresh()
+    @pyqtSlot()
     def _setParameters(self, state, parameters):
         if state:
+            # reading the lock-in and the Cernox takes a while: it runs on the lock-in thread
             self.text.clear()
-            parameters.retrieveHiddenParams()
-            
-            if parameters.are_valid:
-                self.text.append("Parameters are set:")
-                self.text.append(repr(parameters.table))
-                parameters.savePreset()
-            else:
-                self.text.append("Missing some mandatory parameters. Re-check the parameters definitions and/or " +
-                                 "if the instruments are properly connected to retrieve hidden parameters")
-                self.start_button.setEnabled(False)
+            self.text.append("Retrieving the hidden parameters...")
+            self.start_button.setEnabled(False)
+            self.resume_button.setEnabled(False)
+            future = parameters.lockin.io.submit(parameters.retrieveHiddenParams)
+            self.pending = FutureSignals(future, self._hiddenParamsRetrieved, self._hiddenParamsRetrieved)
+    @pyqtSlot(object)
+    def _hiddenParamsRetrieved(self, result):
+        if not self.set_button.isChecked():
+            return
+        self.text.clear()
+        if self.parameters.are_valid:
+            self.text.append("Parameters are set:")
+            self.text.append(repr(self.parameters.table))
+            self.parameters.savePreset()
+            self.start_button.setEnabled(True)
+            self.resume_button.setEnabled(Measurement.hasCheckpoint())
+        else:
+            self.text.append("Missing some mandatory parameters. Re-check the parameters definitions and/or " +
+                             "if the instruments are properly connected to retrieve hidden parameters")
                 
         
         
@@ -103,6 +123,7 @@ class ParametersInfoPage(QWidget):
 
 class ParametersScanPage(QWidget):
     ENTRY_WIDTH = 80
+    SCAN_MODES  = Measurement.MODES
 
     def __init__(self, parameters):
         super().__init__()
@@ -118,14 +139,17 @@ class ParametersScanPage(QWidget):
         pmp_vel   = EntryWidget(p.pmp_vel, DoubleValidator, self.ENTRY_WIDTH)
         pmp_step  = EntryWidget(p.pmp_step, DoubleValidator, self.ENTRY_WIDTH)
         wait      = EntryWidget(p.wait, DoubleValidator, self.ENTRY_WIDTH)
-        plot_rate = EntryWidget(p.plot_rate, IntValidator, self.ENTRY_WIDTH)
+        plot_fps  = EntryWidget(p.plot_fps, IntValidator, self.ENTRY_WIDTH)
+        mode      = ComboWidget(p.mode, self.SCAN_MODES, self.ENTRY_WIDTH)
+        settle    = EntryWidget(p.settle, DoubleValidator, self.ENTRY_WIDTH)
+        channels  = EntryWidget(p.channels, None, self.ENTRY_WIDTH)
         
         thz_fix_button = QPushButton("Fix at start position")
         pmp_fix_button = QPushButton("Fix at start position")
         
         thz_group   = self._createVGroup("THz delay-line", thz_start, thz_end, thz_vel, thz_step, thz_fix_button)
         pmp_group   = self._createVGroup("Pump delay-line", pmp_start, pmp_end, pmp_vel, pmp_step, pmp_fix_button)
-        other_group = self._createHGroup("Other configs", wait, plot_rate)
+        other_group = self._createHGroup("Other configs", wait, settle, plot_fps, mode, channels)
         
         thz_fix_button.clicked.connect(lambda: self._fixCommand(thz_start, thz_end))
         pmp_fix_button.clicked.connect(lambda: self._fixCommand(pmp_start, pmp_end))
@@ -166,17 +190,23 @@ class MeasurementControlWidget(QWidget):
     def __init__(self, parameters):
         super().__init__()
         
-        self.repeat       = EntryWidget(parameters.unsavable.repeat, IntValidator, self.ENTRY_WIDTH, self.LABEL_WIDTH)
-        self.set_button   = QPushButton("Set")
-        self.start_button = QPushButton("Start")
-        self.stop_button  = QPushButton("Stop")
+        self.repeat        = EntryWidget(parameters.unsavable.repeat, IntValidator, self.ENTRY_WIDTH, self.LABEL_WIDTH)
+        self.average       = CheckBoxWidget(parameters.unsavable.average)
+        self.keep_raw      = CheckBoxWidget(parameters.unsavable.keep_raw)
+        self.timing        = CheckBoxWidget(parameters.unsavable.timing)
+        self.temp_rate     = EntryWidget(parameters.unsavable.temp_rate, DoubleValidator, self.ENTRY_WIDTH, self.LABEL_WIDTH)
+        self.set_button    = QPushButton("Set")
+        self.start_button  = QPushButton("Start")
+        self.resume_button = QPushButton("Resume")
+        self.stop_button   = QPushButton("Stop")
         
         self.set_button.setCheckable(True)
         self.start_button.setEnabled(False)
+        self.resume_button.setEnabled(False)
         self.stop_button.setEnabled(False)
         
         layout = QHBoxLayout(self)
-        for item in (self.repeat, self.set_button, self.start_button, self.stop_button):
+        for item in (self.repeat, self.average, self.keep_raw, self.timing, self.temp_rate, self.set_button, self.start_button, self.resume_button, self.stop_button):
             layout.addWidget(item)
         
         layout.setAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop)
@@ -187,6 +217,7 @@ class MeasurementControlWidget(QWidget):
     def _connectSlots(self):
         self.set_button.toggled.connect(lambda state: self._setButtonToggled(state))
         self.start_button.clicked.connect(self._startButtonClicked)
+        self.resume_button.clicked.connect(self._startButtonClicked)
         self.stop_button.clicked.connect(self._stopButtonClicked)
         
     @pyqtSlot()
@@ -194,11 +225,18 @@ class MeasurementControlWidget(QWidget):
         self.set_button.setEnabled(True)
         self.set_button.setText("Unset" if state else "Set")
         self.repeat.setEnabled(not state)
+        self.average.setEnabled(not state)
+        self.keep_raw.setEnabled(not state)
+        self.timing.setEnabled(not state)
+        self.temp_rate.setEnabled(not state)
         self.stop_button.setEnabled(False)
-        self.start_button.setEnabled(state)
+        # enabled once the hidden parameters are retrieved and all the parameters are valid
+        self.start_button.setEnabled(False)
+        self.resume_button.setEnabled(False)
     @pyqtSlot()
     def _startButtonClicked(self):
         self.start_button.setEnabled(False)
+        self.resume_button.setEnabled(False)
         self.set_button.setEnabled(False)
         self.stop_button.setEnabled(True)
     @pyqtSlot()
@@ -243,6 +281,9 @@ class EntryWidget(QWidget):
         self.setSizePolicy(QSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Fixed))
         
     @pyqtSlot()
+    def refresh(self):
+        self.entry.setText(str(self.param.value))
+    @pyqtSlot()
     def setValueToParam(self):
         if self.entry.hasAcceptableInput():
             self.param.setValue(self.entry.text())
@@ -250,15 +291,61 @@ class EntryWidget(QWidget):
             self.param.setValue("")
             
             
+class ComboWidget(QWidget):
+    UNIT_WIDTH       = 40
+    CONTENTS_MARGINS = 0, 5, 0, 0
+    
+    def __init__(self, param, items, COMBO_WIDTH=100, LABEL_WIDTH=80):
+        super().__init__()
+        
+        self.LABEL_WIDTH = LABEL_WIDTH
+        self.COMBO_WIDTH = COMBO_WIDTH
+        
+        self.param = param
+        self.label = QLabel(f"{self.param.name}:")
+        self.combo = QComboBox()
+        self.unit  = QLabel(self.param.unit)
+        
+        self.label.setFixedWidth(self.LABEL_WIDTH)
+        self.combo.setFixedWidth(self.COMBO_WIDTH)
+        self.unit.setFixedWidth(self.UNIT_WIDTH)
+        
+        self.combo.addItems(items)
+        if self.param.value in items:
+            self.combo.setCurrentText(self.param.value)
+        self.setValueToParam()
+        self.combo.currentTextChanged.connect(self.setValueToParam)
+        
+        layout = QHBoxLayout(self)
+        for item in (self.label, self.combo, self.unit):
+            layout.addWidget(item)
+            
+        layout.setContentsMargins(*self.CONTENTS_MARGINS)
+        layout.setAlignment(Qt.AlignmentFlag.AlignLeft)
+        
+        self.setSizePolicy(QSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Fixed))
+        
+    @pyqtSlot()
+    def refresh(self):
+        self.combo.setCurrentText(str(self.param.value))
+    @pyqtSlot()
+    def setValueToParam(self):
+        self.param.setValue(self.combo.currentText())
+            
+            
 class CheckBoxWidget(QCheckBox):
     def __init__(self, param):
         super().__init__()
         
         self.param = param
         self.setText(self.param.name)
+        self.setChecked(self.param.value is True)
         self.toggled.connect(lambda state: self.setValueToParam(state))
     
     @pyqtSlot()
+    def refresh(self):
+        self.setChecked(self.param.value in (True, 'True'))
+    @pyqtSlot()
     def setValueToParam(self, state):
         self.param.setValue(state)
             
@@ -0,0 +1,48 @@
+from pyqtgraph import PlotWidget, mkPen, intColor
+from PyQt6.QtWidgets import QWidget, QTableWidget, QTableWidgetItem, QVBoxLayout
+from PyQt6.QtCore import pyqtSlot
+from experiment.timing import Timer
+
+
+class TimingWidget(QWidget):
+    COLUMNS = ('phase', 'count', 'mean (ms)', 'p50 (ms)', 'p90 (ms)', 'p99 (ms)', 'max (ms)', 'share')
+
+    def __init__(self):
+        super().__init__()
+
+        self.table       = QTableWidget(0, len(self.COLUMNS))
+        self.plot_widget = PlotWidget()
+        self.curves      = {}
+
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.verticalHeader().setVisible(False)
+        self.plot_widget.setLogMode(x=True)
+        self.plot_widget.setLabel('bottom', "Duration", "s")
+        self.plot_widget.setLabel('left', "Points")
+        self.plot_widget.addLegend()
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.table)
+        layout.addWidget(self.plot_widget)
+
+    @pyqtSlot()
+    def update(self, summary):
+        """ Shows a Timer.summary: the statistics table and one histogram per phase """
+        total = sum(stats['total'] for stats in summary.values()) or 1
+        self.table.setRowCount(len(summary))
+        for row, (phase, stats) in enumerate(summary.items()):
+            values = (phase, str(stats['count']), *(f"{1e3 * stats[key]:.3f}" for key in ('mean', 'p50', 'p90', 'p99', 'max')),
+                      f"{stats['total'] / total:.0%}")
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(value))
+
+            if phase not in self.curves:
+                pen = mkPen(intColor(len(self.curves), hues=6))
+                self.curves[phase] = self.plot_widget.plot(stepMode='center', pen=pen, name=phase)
+            self.curves[phase].setData(Timer.binEdges(), stats['histogram'])
+
+    @pyqtSlot()
+    def clear(self):
+        self.table.setRowCount(0)
+        for curve in self.curves.values():
+            curve.clear()
\ No newline at end of file
@@ -0,0 +1,30 @@
+import numpy as np
+from experiment import Measurement
+from instruments.simulator import THzPulse
+
+
+def refine(pos, X):
+    """ Runs the coarse-to-fine selection of Measurement.adaptiveScan on a known trace """
+    measurement = Measurement.__new__(Measurement)   # the selection needs no instrument
+    coarse = np.unique(np.r_[np.arange(0, len(pos), Measurement.ADAPTIVE_COARSE), len(pos) - 1])
+    fine   = measurement._refinementIndices(coarse, X[coarse])
+    return np.union1d(coarse, fine)
+
+
+def test_noisy_pulse_is_refined_and_baseline_skipped():
+    pos   = np.around(np.linspace(5, 35, 6001), decimals=4)
+    noise = np.random.default_rng(0).normal(0, 0.3e-9, len(pos))   # the simulator noise at a 1 ms time constant
+    X     = THzPulse().field(pos, 0) + noise
+
+    measured = refine(pos, X)
+    assert len(measured) < 0.25 * len(pos)
+    pulse = np.flatnonzero(np.abs(pos - THzPulse.ZERO) < 0.04)
+    assert np.isin(pulse, measured).all()
+
+
+def test_noise_alone_is_not_refined():
+    pos = np.around(np.linspace(5, 35, 6001), decimals=4)
+    X   = np.random.default_rng(1).normal(0, 0.3e-9, len(pos))
+
+    measured = refine(pos, X)
+    assert len(measured) < 0.11 * len(pos)   # the coarse pass alone is 10%
\ No newline at end of file
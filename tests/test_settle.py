@@ -0,0 +1,38 @@
+import threading
+import time as tm
+import pytest
+from experiment import Measurement
+from instruments import LockIn
+from instruments.simulator import Simulator, THzPulse
+
+
+@pytest.fixture
+def settled():
+    """ Returns settle(slope): steps the simulated THz stage onto the pulse peak, runs Measurement._settle
+    and returns the error of the released reading and the tolerance, both relative to the step """
+    simulator = Simulator(latency=0, stage_timing=False, noise=0)
+    simulator.install()
+    lockin = LockIn()
+    lockin.setAddress(Simulator.LOCKIN_ADDRESS)
+    lockin.connect()
+    lockin.setTcons(3e-3)
+
+    measurement = Measurement.__new__(Measurement)   # the settle check only needs the lock-in
+    measurement.lockin   = lockin
+    measurement._stopped = threading.Event()
+
+    def settle(slope):
+        lockin.setSlope(slope)
+        tcons = lockin.tcons()
+        step  = THzPulse().field(THzPulse.ZERO + 0.0044, 0)   # near the peak, from a zero baseline
+        simulator.thz_stage.moveTo(THzPulse.ZERO + 0.0044, tm.perf_counter())
+        tol = 1e-2 * abs(step)   # a 1% settle tolerance with the pulse at full scale
+        measurement._settle(tcons, 100 * tcons, tol)
+        return abs(lockin.X() - step) / abs(step), tol / abs(step)
+    return settle
+
+
+@pytest.mark.parametrize('slope', [6, 12, 18, 24])
+def test_settle_waits_for_the_filter_order(settled, slope):
+    error, tol = settled(slope)
+    assert error < 5 * tol
@@ -1,43 +1,67 @@
+import time as tm
+START = tm.perf_counter()   # startup time, reported once the window is shown
+
 import sys
-import numpy as np
-import pandas as pd
+import argparse
 from PyQt6.QtWidgets import QApplication
-from PyQt6.QtCore import QThreadPool, QRunnable, pyqtSlot
-from interface import MainWindow, InstrumentWidget, ParametersWidget, LivePlot
-from instruments import VISAInstrument, LockIn, KBD101, OttimeDelayline_foo, Cernox
+from interface import MainWindow, InstrumentWidget, ParametersWidget, LivePlot, ArchiveWidget, TimingWidget
+from instruments import LockIn, KBD101, OttimeDelayline, OttimeDelayline_foo, Cernox, Simulator
 from experiment import Parameters, Measurement
 
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--simulate', action='store_true', help="use simulated instruments instead of the hardware")
+    parser.add_argument('--latency', type=float, default=Simulator.LATENCY, help="simulated GPIB latency (s)")
+    parser.add_argument('--instant-stages', action='store_true', help="simulated delay-lines move instantly")
+    args, qt_args = parser.parse_known_args()
+    
+    app = QApplication(sys.argv[:1] + qt_args)
+    
+    if args.simulate:
+        Simulator(latency=args.latency, stage_timing=not args.instant_stages).install()
     
     # tools:
     lockin      = LockIn()
     cernox      = Cernox()
     thz_dl      = KBD101("THz delay-line")
-    pmp_dl      = OttimeDelayline_foo("Pump delay-line")
+    pmp_dl      = OttimeDelayline("Pump delay-line") if args.simulate else OttimeDelayline_foo("Pump delay-line")
     parameters  = Parameters(lockin, cernox)
     measurement = Measurement(parameters, lockin, cernox, thz_dl, pmp_dl)
-    thread_pool = QThreadPool()
     
     # widgets:
     liveplot_widget   = LivePlot()
     instrument_widget = InstrumentWidget(lockin, cernox, thz_dl, pmp_dl)
     parameters_widget = ParametersWidget(parameters)
+    archive_widget    = ArchiveWidget(measurement.catalog)
+    timing_widget     = TimingWidget()
     
     # connect slots:
     parameters_widget.set_button.toggled.connect(lambda state: instrument_widget.setPagesEnabled(not state))
     parameters_widget.start_button.clicked.connect(lambda: measurement.run())
+    parameters_widget.start_button.clicked.connect(lambda: timing_widget.clear())
+    parameters_widget.resume_button.clicked.connect(lambda: measurement.resume())
+    parameters_widget.resume_button.clicked.connect(lambda: parameters_widget.refreshPages())
     parameters_widget.stop_button.clicked.connect(lambda: measurement.setBreak(True))
-    measurement.signals.updated.connect(lambda x, y: liveplot_widget.update(x, y))
+    measurement.signals.cleared.connect(lambda pos: liveplot_widget.reset(pos))
+    measurement.signals.gridCleared.connect(lambda x, y: liveplot_widget.resetImage(x, y))
+    measurement.signals.updated.connect(lambda i, x, y: liveplot_widget.update(i, x, y))
+    measurement.signals.averaged.connect(lambda i, x, y, err: liveplot_widget.updateBand(i, x, y, err))
+    measurement.signals.imaged.connect(lambda j, row: liveplot_widget.updateImage(j, row))
+    measurement.signals.timed.connect(lambda summary: timing_widget.update(summary))
     measurement.signals.finished.connect(lambda: parameters_widget.set_button.setChecked(False))
+    for instrument in (lockin, cernox, thz_dl, pmp_dl):
+        app.aboutToQuit.connect(instrument.io.shutdown)   # ends the instrument threads with the window
     
     # main window:
     main_window = MainWindow()
     main_window.setLivePlot(liveplot_widget) 
     main_window.setInstrumentWidget(instrument_widget)
     main_window.setParametersWidget(parameters_widget)
+    main_window.setArchiveWidget(archive_widget)
+    main_window.setTimingWidget(timing_widget)
     
     main_window.show()
+    print(f"Started in {tm.perf_counter() - START:.2f} s (python -X importtime thzcontrol.py details the imports)")
     
     sys.exit(app.exec())
\ No newline at end of file
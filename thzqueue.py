@@ -0,0 +1,66 @@
+import sys
+import argparse
+from PyQt6.QtCore import QCoreApplication
+from instruments import LockIn, KBD101, OttimeDelayline, OttimeDelayline_foo, Cernox, Simulator
+from experiment import Parameters, Measurement, ScanQueue
+
+
+if __name__ == '__main__':
+    # usage: python thzqueue.py recipes.json [more recipes.yaml] [--keep-order] [--dry-run]
+    # the instruments are connected at their preset addresses, saved by thzcontrol.py at each connection
+    parser = argparse.ArgumentParser(description="Runs a queue of scan recipes without the GUI")
+    parser.add_argument('recipes', nargs='+', help="JSON or YAML recipe files, run one after the other")
+    parser.add_argument('--keep-order', action='store_true', help="run the recipes as written, without shortening the travel")
+    parser.add_argument('--dry-run', action='store_true', help="check and print the queue without connecting the instruments")
+    parser.add_argument('--simulate', action='store_true', help="use simulated instruments instead of the hardware")
+    parser.add_argument('--latency', type=float, default=Simulator.LATENCY, help="simulated GPIB latency (s)")
+    parser.add_argument('--instant-stages', action='store_true', help="simulated delay-lines move instantly")
+    args = parser.parse_args()
+
+    app = QCoreApplication(sys.argv[:1])
+
+    if args.simulate:
+        Simulator(latency=args.latency, stage_timing=not args.instant_stages).install()
+
+    # tools:
+    lockin      = LockIn()
+    cernox      = Cernox()
+    thz_dl      = KBD101("THz delay-line")
+    pmp_dl      = OttimeDelayline("Pump delay-line") if args.simulate else OttimeDelayline_foo("Pump delay-line")
+    parameters  = Parameters(lockin, cernox)
+    measurement = Measurement(parameters, lockin, cernox, thz_dl, pmp_dl)
+
+    try:
+        recipes = [recipe for path in args.recipes for recipe in ScanQueue.load(path)]
+    except Exception as error:
+        sys.exit(f"Could not read the recipes: {error}")
+    queue  = ScanQueue(measurement, recipes)
+    errors = queue.validate()
+    if errors:
+        sys.exit("Invalid recipes:\n" + "\n".join(errors))
+    if not args.keep_order:
+        queue.order()
+
+    if args.dry_run:
+        for k, recipe in enumerate(queue.recipes):
+            thz_start, pmp_start = queue.start(recipe)
+            thz_end, pmp_end     = queue.end(recipe)
+            print(f"{queue.label(k)}: THz {thz_start}-{thz_end} mm, pump {pmp_start}-{pmp_end} mm")
+        print(f"About {queue.travelTime():.0f} s of delay-line travel between the scans")
+        sys.exit()
+
+    addresses = {lockin: Simulator.LOCKIN_ADDRESS, cernox: Simulator.MULTIMETER_ADDRESS,
+                 thz_dl: Simulator.KBD101_SERIAL, pmp_dl: Simulator.OTTIME_ADDRESS}
+    for instrument in (lockin, cernox, thz_dl, pmp_dl):
+        instrument.setAddress(addresses[instrument] if args.simulate else instrument.loadPresetAddress())
+        instrument.connect()
+        if instrument.device is None and not isinstance(instrument, OttimeDelayline_foo):
+            sys.exit(f"The {instrument.name} is not connected, the queue is cancelled")
+
+    try:
+        complete = queue.run()
+    finally:
+        for instrument in (lockin, cernox, thz_dl, pmp_dl):
+            instrument.disconnect()
+            instrument.io.shutdown()
+    sys.exit(0 if complete == len(queue.recipes) else 1)
\ No newline at end of file